@@ -1,20 +1,16 @@
 import json
-import boto3
 from typing import Dict, Any
-from langchain_community.llms.ollama import Ollama
+from RAG.resources import get_registry
 
 class AWSMCPServer:
     """MCP Server for AWS operations using natural language"""
     
     def __init__(self):
-        self.llm = Ollama(model="llama3.1")
-        self.aws_clients = {}
+        self.llm = get_registry().llm("llama3.1")
         
     def get_aws_client(self, service: str):
-        """Get AWS client for service"""
-        if service not in self.aws_clients:
-            self.aws_clients[service] = boto3.client(service, region_name='us-east-1')
-        return self.aws_clients[service]
+        """Get AWS client for service (shared process-wide, with pooled connections)"""
+        return get_registry().client(service)
     
     def process_natural_language(self, user_input: str) -> Dict[str, Any]:
         """Process natural language input and execute AWS operations"""
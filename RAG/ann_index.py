@@ -0,0 +1,537 @@
+import base64
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from RAG.vector_codec import decode_vector
+
+# At the repository root whatever the working directory, like LEXICAL_INDEX_PATH, so
+# populate_database keeps an index built by scripts/ann_report.py up to date
+ANN_INDEX_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ann_index")
+
+# Vectors are assigned to centroids in blocks of this many rows to bound memory
+_ASSIGN_BLOCK = 8192
+
+# Names inside the index directory: CURRENT holds the name of the live version directory
+_CURRENT = 'CURRENT'
+_VERSION = re.compile(r'^v(\d+)$')
+_LOG = 'log.jsonl'
+
+
+class IVFIndex:
+    """Inverted-file approximate nearest neighbour index over normalized vectors.
+
+    Vectors are clustered into `nlist` lists with spherical k-means and stored
+    list by list in `vectors.npy`, which is memory-mapped on load. A search
+    scores only the `nprobe` lists whose centroids are closest to the query, so
+    raising nprobe trades latency for recall. Vectors added after the last
+    build live in a small exact-searched delta and deletions are tombstones,
+    both folded into the lists by `compact`.
+
+    On disk every build or compaction is a new version directory (v000001,
+    v000002, ...) that CURRENT is atomically switched to once it is complete.
+    Adds and removes in between are appended to that version's log.jsonl and
+    replayed on load, so a write costs time proportional to its own size.
+    Several processes can share the directory: before every change an
+    instance catches up, reloading if CURRENT moved to another version and
+    else replaying what others appended to the log since it last read it.
+    """
+
+    def __init__(self, path: str, nprobe: int = 8):
+        self.path = path
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        # Held for a whole count check or build so concurrent first searches don't each run one
+        self._build_lock = threading.Lock()
+        self.loaded = False
+        # time.monotonic() of the last build or count check against the table in this process
+        self.checked_at: Optional[float] = None
+        # Version directory the log is appended to; None until first saved or loaded
+        self._version: Optional[str] = None
+        # Bytes of that version's log applied so far; our own appends are replayed again (harmlessly)
+        self._log_offset = 0
+        self._reset(dim=0)
+
+    def _reset(self, dim: int):
+        self.centroids = np.zeros((0, dim), dtype=np.float32)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.ids: List[str] = []
+        self.sources: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self.delta = np.zeros((0, dim), dtype=np.float32)
+        self.delta_ids: List[str] = []
+        self.delta_sources: List[str] = []
+        # Tombstones: False marks a list row deleted since the last compaction
+        self.alive = np.ones(0, dtype=bool)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self.alive.sum()) + len(self.delta_ids)
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1] if self.vectors.shape[1] else self.delta.shape[1]
+
+    # ---------------------- Build ----------------------
+
+    def build(self, items: Iterable[Dict[str, Any]], nlist: Optional[int] = None,
+              iterations: int = 10, seed: int = 0):
+        """Train centroids and lay out the lists from EMBEDDINGS items"""
+        ids, sources, rows = [], [], []
+        for item in items:
+            ids.append(item['id'])
+            sources.append(item.get('source', ''))
+            rows.append(decode_vector(item))
+        vectors = _normalize_rows(np.vstack(rows)) if rows else np.zeros((0, 0), dtype=np.float32)
+
+        with self._lock:
+            self._build_lists(ids, sources, vectors, nlist, iterations, seed)
+            self.loaded = True
+            self.save()
+            self.checked_at = time.monotonic()
+
+    def ensure_loaded(self, build: Callable[[], Any], table_count: Optional[Callable[[], int]] = None,
+                      max_age: Optional[float] = None):
+        """Call build() unless the index is loaded and in step with the table.
+
+        As in BM25Index.ensure_loaded, table_count, when given, returns the
+        table's item count. After catching up with the directory the index is
+        compared with it on first use in the process and again once max_age
+        seconds have passed, and a mismatch (writes by a process that does not
+        keep this index) rebuilds it. Concurrent callers wait for that one
+        check or build.
+        """
+        if self._current(table_count, max_age):
+            return
+        with self._build_lock:
+            if self._current(table_count, max_age):
+                return
+            if self.loaded and table_count is not None:
+                with self._lock:
+                    self._sync()
+                if table_count() == len(self):
+                    self.checked_at = time.monotonic()
+                    return
+            build()
+
+    def _current(self, table_count: Optional[Callable[[], int]], max_age: Optional[float]) -> bool:
+        if not self.loaded:
+            return False
+        if table_count is None:
+            return True
+        return self.checked_at is not None and (max_age is None or time.monotonic() - self.checked_at < max_age)
+
+    def _build_lists(self, ids: List[str], sources: List[str], vectors: np.ndarray,
+                     nlist: Optional[int], iterations: int, seed: int):
+        self._reset(dim=vectors.shape[1] if vectors.ndim == 2 else 0)
+        if len(ids) == 0:
+            return
+
+        if nlist is None:
+            # Rule of thumb: about sqrt(N) lists keeps list scans and centroid scoring balanced
+            nlist = int(np.sqrt(len(ids)))
+        nlist = max(1, min(nlist, len(ids)))
+
+        self.centroids = _spherical_kmeans(vectors, nlist, iterations, seed)
+        assignments = self._assign(vectors)
+        order = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=nlist)
+
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.vectors = np.ascontiguousarray(vectors[order])
+        self._set_rows([ids[i] for i in order], [sources[i] for i in order])
+
+    def _set_rows(self, ids: List[str], sources: List[str]):
+        self.ids = ids
+        self.sources = sources
+        self._rows = {doc_id: row for row, doc_id in enumerate(ids)}
+        self.alive = np.ones(len(ids), dtype=bool)
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Nearest centroid for each row"""
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), _ASSIGN_BLOCK):
+            block = vectors[start:start + _ASSIGN_BLOCK]
+            assignments[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return assignments
+
+    # ---------------------- Incremental updates ----------------------
+
+    def add(self, ids: List[str], embeddings: List[List[float]], sources: List[str]):
+        """Add or replace vectors; new rows go to the exact-searched delta"""
+        if not ids:
+            return
+        with self._lock:
+            self._sync()
+            vectors = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+            self._apply_add(list(ids), list(sources), vectors)
+            self._commit({'op': 'add', 'ids': list(ids), 'sources': list(sources),
+                          'vectors': base64.b64encode(vectors.tobytes()).decode('ascii')})
+
+    def remove(self, ids: Iterable[str]):
+        """Delete vectors by ID"""
+        with self._lock:
+            self._sync()
+            removed = self._apply_remove(set(ids))
+            if removed:
+                self._commit({'op': 'remove', 'ids': removed})
+
+    def remove_source(self, source: str):
+        """Delete every vector that came from a source file"""
+        with self._lock:
+            self._sync()
+            ids = {doc_id for doc_id, doc_source in zip(self.ids, self.sources) if doc_source == source}
+            ids.update(doc_id for doc_id, doc_source in zip(self.delta_ids, self.delta_sources) if doc_source == source)
+            removed = self._apply_remove(ids)
+            if removed:
+                self._commit({'op': 'remove', 'ids': removed})
+
+    def clear(self):
+        """Drop all vectors, keeping the trained centroids for future adds"""
+        with self._lock:
+            centroids = self.centroids
+            self._reset(dim=self.dim)
+            self.centroids = centroids
+            self.offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+            self.save()
+
+    def invalidate(self):
+        """Mark the index as out of step with the table so the next search rebuilds it"""
+        with self._lock:
+            self.loaded = False
+
+    def _apply_add(self, ids: List[str], sources: List[str], vectors: np.ndarray):
+        if self.dim == 0:
+            self._reset(dim=vectors.shape[1])
+        # Replaced IDs are tombstoned in the lists and dropped from the delta
+        replaced = set(ids)
+        rows = [self._rows[doc_id] for doc_id in replaced if doc_id in self._rows]
+        self.alive[rows] = False
+        keep = [i for i, doc_id in enumerate(self.delta_ids) if doc_id not in replaced]
+        self.delta = np.vstack([self.delta[keep], vectors])
+        self.delta_ids = [self.delta_ids[i] for i in keep] + ids
+        self.delta_sources = [self.delta_sources[i] for i in keep] + sources
+
+    def _apply_remove(self, ids: Set[str]) -> List[str]:
+        """Tombstone list rows and drop delta rows; returns the IDs that were present"""
+        rows = [self._rows[doc_id] for doc_id in ids if doc_id in self._rows]
+        rows = [row for row in rows if self.alive[row]]
+        self.alive[rows] = False
+        removed = [self.ids[row] for row in rows]
+        keep = []
+        for i, doc_id in enumerate(self.delta_ids):
+            if doc_id in ids:
+                removed.append(doc_id)
+            else:
+                keep.append(i)
+        if len(keep) < len(self.delta_ids):
+            self.delta = self.delta[keep]
+            self.delta_ids = [self.delta_ids[i] for i in keep]
+            self.delta_sources = [self.delta_sources[i] for i in keep]
+        return removed
+
+    def _commit(self, record: Dict[str, Any]):
+        """Persist one change: fold everything into a new version once the delta and
+        tombstones grow large, else append the change to the current version's log"""
+        pending = len(self.delta_ids) + int((~self.alive).sum())
+        if self._version is None or pending > max(1000, len(self.ids) // 10):
+            self._compact()
+        else:
+            self._append_log(record)
+
+    def compact(self):
+        """Assign delta rows to their nearest lists and physically drop tombstones.
+
+        Surviving list rows keep their list, so the new vectors.npy is written
+        one list at a time from the memory-mapped old one rather than loading it.
+        """
+        with self._lock:
+            self._sync()
+            self._compact()
+
+    def _compact(self):
+        with self._lock:
+            if self.nlist == 0:
+                # Never trained (the index was built empty): train on the delta
+                self._build_lists(self.delta_ids, self.delta_sources, self.delta, None, 10, 0)
+                self.save()
+                return
+            if len(self) == 0:
+                self.clear()
+                return
+
+            assignments = self._assign(self.delta)
+            delta_order = np.argsort(assignments, kind='stable')
+            delta_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=self.nlist))])
+            alive_before = np.concatenate([[0], np.cumsum(self.alive)])
+            kept = alive_before[self.offsets[1:]] - alive_before[self.offsets[:-1]]
+            offsets = np.concatenate([[0], np.cumsum(kept + np.diff(delta_offsets))]).astype(np.int64)
+
+            ids: List[str] = []
+            sources: List[str] = []
+
+            def write_vectors(path: str):
+                out = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(int(offsets[-1]), self.dim))
+                for j in range(self.nlist):
+                    start, end = int(self.offsets[j]), int(self.offsets[j + 1])
+                    rows = np.flatnonzero(self.alive[start:end]) + start
+                    added = delta_order[delta_offsets[j]:delta_offsets[j + 1]]
+                    position = int(offsets[j])
+                    out[position:position + len(rows)] = np.asarray(self.vectors[start:end])[rows - start]
+                    out[position + len(rows):int(offsets[j + 1])] = self.delta[added]
+                    ids.extend(self.ids[row] for row in rows)
+                    ids.extend(self.delta_ids[i] for i in added)
+                    sources.extend(self.sources[row] for row in rows)
+                    sources.extend(self.delta_sources[i] for i in added)
+                out.flush()
+                del out
+
+            centroids = self.centroids
+            directory = self._publish(centroids, offsets, write_vectors, lambda: (ids, sources))
+            dim = self.dim
+            self._reset(dim=dim)
+            self.centroids = centroids
+            self.offsets = offsets
+            self.vectors = np.load(os.path.join(directory, 'vectors.npy'), mmap_mode='r')
+            self._set_rows(ids, sources)
+
+    # ---------------------- Search ----------------------
+
+    def search(self, query_embedding: List[float], k: int = 5, nprobe: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Return (id, cosine score) pairs for the approximate top k"""
+        with self._lock:
+            if len(self) == 0 or k <= 0:
+                return []
+
+            query = _normalize_rows(np.asarray(query_embedding, dtype=np.float32)[None, :])[0]
+            candidate_ids: List[str] = []
+            candidate_scores: List[np.ndarray] = []
+            has_tombstones = not self.alive.all()
+
+            if self.nlist:
+                probes = min(nprobe or self.nprobe, self.nlist)
+                centroid_scores = self.centroids @ query
+                lists = np.argpartition(-centroid_scores, probes - 1)[:probes]
+                for j in lists:
+                    start, end = int(self.offsets[j]), int(self.offsets[j + 1])
+                    if start == end:
+                        continue
+                    scores = np.asarray(self.vectors[start:end]) @ query
+                    if has_tombstones:
+                        scores[~self.alive[start:end]] = -np.inf
+                    candidate_scores.append(scores)
+                    candidate_ids.extend(self.ids[start:end])
+
+            if self.delta_ids:
+                candidate_scores.append(self.delta @ query)
+                candidate_ids.extend(self.delta_ids)
+
+            if not candidate_ids:
+                return []
+
+            scores = np.concatenate(candidate_scores)
+            count = min(k, len(scores))
+            top = np.argpartition(-scores, count - 1)[:count]
+            top = top[np.argsort(-scores[top], kind='stable')]
+            return [(candidate_ids[i], float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    # ---------------------- Persistence ----------------------
+
+    def save(self):
+        """Write the whole index as a new version, folding in any delta rows and tombstones"""
+        with self._lock:
+            if len(self.delta_ids) or not self.alive.all():
+                self._compact()
+                return
+            self._publish(self.centroids, self.offsets, lambda path: np.save(path, self.vectors),
+                          lambda: (self.ids, self.sources))
+
+    def _publish(self, centroids: np.ndarray, offsets: np.ndarray, write_vectors: Callable[[str], None],
+                 rows: Callable[[], Tuple[List[str], List[str]]]) -> str:
+        """Write a complete version directory, then switch CURRENT to it and drop older versions"""
+        os.makedirs(self.path, exist_ok=True)
+        numbers = [int(match.group(1)) for match in map(_VERSION.match, os.listdir(self.path)) if match]
+        version = f"v{max(numbers, default=0) + 1:06d}"
+        directory = os.path.join(self.path, version)
+        os.makedirs(directory)
+
+        write_vectors(os.path.join(directory, 'vectors.npy'))
+        np.save(os.path.join(directory, 'centroids.npy'), centroids)
+        np.save(os.path.join(directory, 'offsets.npy'), offsets)
+        ids, sources = rows()
+        with open(os.path.join(directory, 'ids.json'), 'w') as f:
+            json.dump({'ids': ids, 'sources': sources}, f)
+        open(os.path.join(directory, _LOG), 'w').close()
+
+        # Readers see either the old version or the complete new one
+        tmp_path = os.path.join(self.path, _CURRENT + '.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(version)
+        os.replace(tmp_path, os.path.join(self.path, _CURRENT))
+        self._version = version
+        self._log_offset = 0
+
+        for name in os.listdir(self.path):
+            if _VERSION.match(name) and name != version:
+                # Best effort: a file another process still has mapped may not be removable yet
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+        return directory
+
+    def _sync(self):
+        """Catch up with other processes writing to the directory, if this index is loaded"""
+        if not self.loaded or self._version is None:
+            return
+        version = self._read_current()
+        if version is None:
+            return
+        if version != self._version:
+            self.load()
+        else:
+            self._log_offset = self._replay(os.path.join(self.path, version, _LOG), self._log_offset, truncate=False)
+
+    def _read_current(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.path, _CURRENT)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _append_log(self, record: Dict[str, Any]):
+        with open(os.path.join(self.path, self._version, _LOG), 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def load(self) -> bool:
+        """Memory-map the current saved version and replay its log; returns False if none exists at path"""
+        with self._lock:
+            version = self._read_current()
+            if version is None:
+                return False
+
+            directory = os.path.join(self.path, version)
+            with open(os.path.join(directory, 'ids.json')) as f:
+                meta = json.load(f)
+            vectors = np.load(os.path.join(directory, 'vectors.npy'), mmap_mode='r')
+            self._reset(dim=vectors.shape[1])
+            self.vectors = vectors
+            self.centroids = np.load(os.path.join(directory, 'centroids.npy'))
+            self.offsets = np.load(os.path.join(directory, 'offsets.npy'))
+            self._set_rows(meta['ids'], meta['sources'])
+            self._version = version
+            self._log_offset = self._replay(os.path.join(directory, _LOG))
+            self.loaded = True
+            return True
+
+    def _replay(self, log_path: str, start: int = 0, truncate: bool = True) -> int:
+        """Apply the logged changes after byte offset start in order; returns the offset after the last
+        complete record. With truncate a record torn by an interrupted append is cut off; without, it
+        may be another process's append in progress and is left for the next call."""
+        if not os.path.exists(log_path):
+            return start
+        with open(log_path, 'rb') as f:
+            f.seek(start)
+            data = f.read()
+
+        applied = 0
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b'\n'):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if record['op'] == 'add':
+                vectors = np.frombuffer(base64.b64decode(record['vectors']), dtype=np.float32)
+                self._apply_add(record['ids'], record['sources'], vectors.reshape(len(record['ids']), -1))
+            else:
+                self._apply_remove(set(record['ids']))
+            applied += len(line)
+
+        if truncate and applied < len(data):
+            with open(log_path, 'r+b') as f:
+                f.truncate(start + applied)
+        return start + applied
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _spherical_kmeans(vectors: np.ndarray, nlist: int, iterations: int, seed: int) -> np.ndarray:
+    """Cluster unit vectors by cosine similarity, training on a bounded sample"""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), 256 * nlist)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        empty = np.bincount(assignments, minlength=nlist) == 0
+        # Re-seed empty clusters from random points so no list is wasted
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = _normalize_rows(sums)
+
+    return centroids
+
+
+# One index per directory shared by every store in the process
+_shared_indexes: Dict[str, IVFIndex] = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_ann_index(path: str, nprobe: int = 8) -> IVFIndex:
+    """Return the process-wide IVF index for a directory, loading it if saved"""
+    with _shared_lock:
+        path = os.path.abspath(path)
+        if path not in _shared_indexes:
+            index = IVFIndex(path, nprobe=nprobe)
+            index.load()
+            _shared_indexes[path] = index
+        return _shared_indexes[path]
+
+
+def recall_report(ids: List[str], vectors: np.ndarray, index: IVFIndex, k: int = 5,
+                  queries: int = 100, nprobes: Tuple[int, ...] = (1, 2, 4, 8, 16, 32),
+                  seed: int = 0) -> List[Dict[str, float]]:
+    """Compare the index against brute force: recall@k and mean latency per nprobe.
+
+    Queries are corpus vectors with a little Gaussian noise, which resembles
+    questions phrased close to a chunk's own wording.
+    """
+    rng = np.random.default_rng(seed)
+    matrix = _normalize_rows(vectors)
+    picks = rng.choice(len(matrix), min(queries, len(matrix)), replace=False)
+    query_matrix = _normalize_rows(matrix[picks] + rng.normal(0, 0.05, (len(picks), matrix.shape[1])).astype(np.float32))
+
+    start = time.perf_counter()
+    exact_scores = query_matrix @ matrix.T
+    exact_top = np.argsort(-exact_scores, axis=1)[:, :k]
+    exact_ms = (time.perf_counter() - start) * 1000 / len(picks)
+    expected = [{ids[i] for i in row} for row in exact_top]
+
+    report = [{'nprobe': 0, 'recall': 1.0, 'latency_ms': exact_ms}]
+    for nprobe in nprobes:
+        if nprobe > max(index.nlist, 1):
+            break
+        hits = 0
+        start = time.perf_counter()
+        for query, truth in zip(query_matrix, expected):
+            found = {doc_id for doc_id, _ in index.search(query, k, nprobe=nprobe)}
+            hits += len(found & truth)
+        latency_ms = (time.perf_counter() - start) * 1000 / len(picks)
+        report.append({'nprobe': nprobe, 'recall': hits / (k * len(picks)), 'latency_ms': latency_ms})
+
+    return report
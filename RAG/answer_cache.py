@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from RAG.embedding_cache import normalize_query, text_hash
+from RAG.telemetry import metric
+
+ANSWER_CACHE_PATH = "answer_cache.sqlite3"
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    vector: np.ndarray
+    source_ids: Tuple[str, ...]
+    digest: str
+    answer: str
+    created: float
+
+    @property
+    def sources(self) -> set:
+        """Source files the answer was generated from"""
+        return {source_of(doc_id) for doc_id in self.source_ids}
+
+
+def source_of(doc_id: str) -> str:
+    # Chunk IDs look like "data/monopoly.pdf:6:2"
+    return doc_id.rsplit(":", 2)[0]
+
+
+def context_digest(results: List[Tuple[Document, float]]) -> str:
+    """SHA-256 of the IDs and text of the retrieved chunks, in rank order"""
+    digest = hashlib.sha256()
+    for doc, _score in results:
+        digest.update(str(doc.metadata.get("id")).encode("utf-8") + b"\0")
+        digest.update(doc.page_content.encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+
+class AnswerCache:
+    """Answers keyed by question embedding, reused for near-duplicate questions.
+
+    A lookup hits when a cached question's embedding has cosine similarity of
+    at least `threshold` with the new one and retrieval returned the same
+    chunks, with the same text, that the cached answer was generated from.
+    Entries expire after `ttl_seconds` and the least recently used ones are
+    evicted beyond `max_entries`. With a path, entries are also kept in SQLite.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 512,
+                 ttl_seconds: Optional[float] = 24 * 3600, path: Optional[str] = None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self._entries: "OrderedDict[str, CachedAnswer]" = OrderedDict()
+        # Stacked question vectors, rebuilt after the entries change
+        self._matrix: Optional[np.ndarray] = None
+        self._keys: List[str] = []
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self._open(path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+    def get(self, query_embedding: List[float], results: List[Tuple[Document, float]]) -> Optional[str]:
+        """Cached answer for a question whose retrieval returned `results`, if any"""
+        source_ids = tuple(str(doc.metadata.get("id")) for doc, _score in results)
+        digest = context_digest(results)
+        query = _normalize(query_embedding)
+
+        with self._lock:
+            self._expire()
+            if self._entries:
+                scores = self._stacked() @ query
+                for row in np.argsort(-scores, kind="stable"):
+                    if scores[row] < self.threshold:
+                        break
+                    key = self._keys[row]
+                    entry = self._entries[key]
+                    if entry.source_ids == source_ids and entry.digest == digest:
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        metric("answer_cache.hits")
+                        return entry.answer
+            self.misses += 1
+        metric("answer_cache.misses")
+        return None
+
+    def put(self, question: str, query_embedding: List[float],
+            results: List[Tuple[Document, float]], answer: str):
+        """Remember the answer generated for a question"""
+        entry = CachedAnswer(
+            question=question,
+            vector=_normalize(query_embedding),
+            source_ids=tuple(str(doc.metadata.get("id")) for doc, _score in results),
+            digest=context_digest(results),
+            answer=answer,
+            created=time.time(),
+        )
+        key = text_hash(normalize_query(question))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+            self._matrix = None
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, entry.question, entry.vector.astype("<f4").tobytes(), json.dumps(entry.source_ids),
+                     entry.digest, entry.answer, entry.created),
+                )
+                self._delete_rows(evicted)
+                self._conn.commit()
+
+    def invalidate_sources(self, sources: Iterable[str]) -> int:
+        """Drop answers generated from any of the given source files; returns how many"""
+        sources = set(sources)
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry.sources & sources]
+            self._remove(stale)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM answers")
+                self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _open(self, path: str):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "key TEXT PRIMARY KEY, question TEXT NOT NULL, vector BLOB NOT NULL, source_ids TEXT NOT NULL, "
+            "digest TEXT NOT NULL, answer TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+        # Oldest first, so the most recent entries end up most recently used
+        rows = self._conn.execute(
+            "SELECT * FROM (SELECT * FROM answers ORDER BY created DESC LIMIT ?) ORDER BY created",
+            (self.max_entries,),
+        ).fetchall()
+        for key, question, vector, source_ids, digest, answer, created in rows:
+            self._entries[key] = CachedAnswer(question, np.frombuffer(vector, dtype="<f4"),
+                                              tuple(json.loads(source_ids)), digest, answer, created)
+        self._expire()
+
+    def _expire(self):
+        if self.ttl_seconds is None:
+            return
+        cutoff = time.time() - self.ttl_seconds
+        self._remove([key for key, entry in self._entries.items() if entry.created < cutoff])
+
+    def _remove(self, keys: List[str]):
+        if not keys:
+            return
+        for key in keys:
+            del self._entries[key]
+        self._matrix = None
+        if self._conn is not None:
+            self._delete_rows(keys)
+            self._conn.commit()
+
+    def _delete_rows(self, keys: List[str]):
+        if keys:
+            self._conn.executemany("DELETE FROM answers WHERE key = ?", [(key,) for key in keys])
+
+    def _stacked(self) -> np.ndarray:
+        if self._matrix is None:
+            self._keys = list(self._entries)
+            self._matrix = np.stack([self._entries[key].vector for key in self._keys])
+        return self._matrix
+
+
+def _normalize(vector: List[float]) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+# One cache per path shared by every caller in the process, so ingestion in
+# the UI process invalidates the same entries the chat reads
+_shared_caches: Dict[Optional[str], AnswerCache] = {}
+_shared_lock = threading.Lock()
+
+
+def get_answer_cache(path: Optional[str] = ANSWER_CACHE_PATH) -> AnswerCache:
+    with _shared_lock:
+        if path not in _shared_caches:
+            _shared_caches[path] = AnswerCache(path=path)
+        return _shared_caches[path]
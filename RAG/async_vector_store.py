@@ -0,0 +1,117 @@
+import asyncio
+import functools
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+from langchain_core.documents import Document
+from RAG.dynamodb_vector_store import BulkWriteReport, DynamoDBVectorStore
+from RAG.search_filter import SearchFilter
+from RAG.telemetry import propagate
+
+
+class PerLoopSemaphore:
+    """Calling it returns an asyncio.Semaphore(value) for the running event loop.
+
+    asyncio primitives belong to one event loop, so a limit shared by code
+    that may run under several loops keeps one semaphore per loop.
+    """
+
+    def __init__(self, value: int):
+        self.value = value
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def __call__(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.value)
+        return self._semaphores[loop]
+
+
+class AsyncDynamoDBVectorStore:
+    """asyncio front end for DynamoDBVectorStore.
+
+    Calls run on a dedicated thread pool, at most max_concurrency at a time,
+    over one boto3 resource whose connection pool is sized to match, so many
+    coroutines can share it without opening extra connections.
+    """
+
+    def __init__(self, store: Optional[DynamoDBVectorStore] = None, max_concurrency: int = 16, **store_kwargs):
+        if store is None:
+            # The store's own worker pools also use connections from this pool
+            pool_size = max_concurrency * store_kwargs.get('max_workers', 8)
+            store_kwargs.setdefault('max_pool_connections', pool_size)
+            store = DynamoDBVectorStore(**store_kwargs)
+        self.store = store
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="async-vector-store")
+        self._semaphore = PerLoopSemaphore(max_concurrency)
+
+    async def asimilarity_search_with_score(self, query_embedding: List[float], k: int = 5, exact: bool = True,
+                                            search_filter: Optional[SearchFilter] = None) -> List[Tuple[Document, float]]:
+        return await self._run(self.store.similarity_search_with_score, query_embedding, k,
+                               exact=exact, search_filter=search_filter)
+
+    async def ahybrid_search_with_score(self, query_text: str, query_embedding: List[float], k: int = 5,
+                                        search_filter: Optional[SearchFilter] = None) -> List[Tuple[Document, float]]:
+        return await self._run(self.store.hybrid_search_with_score, query_text, query_embedding, k,
+                               search_filter=search_filter)
+
+    async def asimilarity_search_batch(self, query_embeddings: List[List[float]], k: int = 5,
+                                       search_filter: Optional[SearchFilter] = None) -> List[List[Tuple[Document, float]]]:
+        return await self._run(self.store.similarity_search_batch, query_embeddings, k, search_filter=search_filter)
+
+    async def ahybrid_search_batch(self, query_texts: List[str], query_embeddings: List[List[float]], k: int = 5,
+                                   search_filter: Optional[SearchFilter] = None) -> List[List[Tuple[Document, float]]]:
+        return await self._run(self.store.hybrid_search_batch, query_texts, query_embeddings, k,
+                               search_filter=search_filter)
+
+    async def amax_marginal_relevance_search(self, query_embedding: List[float], k: int = 5, fetch_k: int = 20,
+                                             lambda_mult: float = 0.5,
+                                             search_filter: Optional[SearchFilter] = None) -> List[Tuple[Document, float]]:
+        return await self._run(self.store.max_marginal_relevance_search, query_embedding, k, fetch_k,
+                               lambda_mult, search_filter=search_filter)
+
+    async def adiversify(self, query_embedding: List[float], candidates: List[Tuple[Document, float]], k: int = 5,
+                         lambda_mult: float = 0.5, use_scores: bool = False) -> List[Tuple[Document, float]]:
+        return await self._run(self.store.diversify, query_embedding, candidates, k, lambda_mult, use_scores)
+
+    async def asimilarity_search(self, query_embedding: List[float], k: int = 5,
+                                 search_filter: Optional[SearchFilter] = None) -> List[Document]:
+        return await self._run(self.store.similarity_search, query_embedding, k, search_filter=search_filter)
+
+    async def asearch_filters(self, query_embedding: List[float], filters: List[Optional[SearchFilter]],
+                              k: int = 5) -> List[List[Tuple[Document, float]]]:
+        """Run one search per filter concurrently, e.g. one per contract"""
+        return list(await asyncio.gather(*(
+            self.asimilarity_search_with_score(query_embedding, k, search_filter=search_filter)
+            for search_filter in filters
+        )))
+
+    async def aadd_documents(self, documents: List[Document], embeddings: List[List[float]],
+                             ids: Optional[List[str]] = None) -> List[str]:
+        return await self._run(self.store.add_documents, documents, embeddings, ids)
+
+    async def abulk_add_documents(self, documents: List[Document], embeddings: List[List[float]],
+                                  ids: Optional[List[str]] = None) -> BulkWriteReport:
+        return await self._run(self.store.bulk_add_documents, documents, embeddings, ids)
+
+    async def adelete_by_source(self, source: str) -> int:
+        return await self._run(self.store.delete_by_source, source)
+
+    async def aclear_all(self, truncate: bool = False) -> int:
+        return await self._run(self.store.clear_all, truncate)
+
+    async def afind_existing_ids(self, ids: List[str]) -> List[str]:
+        return await self._run(self.store.find_existing_ids, ids)
+
+    async def awarm_index(self):
+        await self._run(self.store.warm_index)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    async def _run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        async with self._semaphore():
+            loop = asyncio.get_running_loop()
+            # run_in_executor does not carry contextvars over, so the caller's trace would miss the call
+            return await loop.run_in_executor(self._executor, propagate(functools.partial(fn, *args, **kwargs)))
@@ -0,0 +1,280 @@
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from RAG.search_filter import SearchFilter
+from RAG.vector_index import top_k
+
+# At the repository root whatever the working directory, so the UI (run from UI/)
+# and populate_database share one index
+LEXICAL_INDEX_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lexical_index.sqlite3")
+
+# Amounts and clause numbers ("$1,250,000.00", "12.3(b)", "15%") stay one token
+_TOKEN = re.compile(r"\$?\d[\d,]*(?:\.\d+)*(?:\([a-z0-9]{1,4}\))*%?|\w+")
+# Zero cents, so "$1,250,000.00" and "$1,250,000" are one term
+_ZERO_CENTS = re.compile(r"\.00(?=%?$)")
+# Stored with the index; files built by an older tokenize() are rebuilt
+TOKENIZER_VERSION = 2
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with "
+    "shall such any all not no than then there these those which who whom".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token[0].isdigit() or token[0] == "$":
+            # "$1,000" and "$1000" are the same amount
+            token = _ZERO_CENTS.sub("", token.replace(",", ""))
+            if token.endswith(")"):
+                # "12.3(b)" is also found by a query for "12.3"
+                tokens.append(token[:token.index("(")])
+        if token not in _STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 inverted index over chunk content, stored in SQLite.
+
+    Postings are looked up by term through SQLite's B-tree, so a query only
+    touches the documents that contain its terms. Documents are added and
+    removed incrementally, and the file can be shared by several processes
+    (the UI and populate_database). Without a path the index lives in memory.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        # Held for a whole build so concurrent first searches don't each rebuild
+        self._build_lock = threading.Lock()
+        # time.monotonic() of the last build or count check against the table in this process
+        self.checked_at: Optional[float] = None
+        self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        with self._lock:
+            if path:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS docs ("
+                "doc_id TEXT PRIMARY KEY, source TEXT NOT NULL, page INTEGER NOT NULL, "
+                "length INTEGER NOT NULL, metadata TEXT NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS docs_source ON docs (source);"
+                "CREATE TABLE IF NOT EXISTS postings ("
+                "term TEXT NOT NULL, doc_id TEXT NOT NULL, tf INTEGER NOT NULL, "
+                "PRIMARY KEY (term, doc_id)) WITHOUT ROWID;"
+                "CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);"
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL NOT NULL);"
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self._meta("doc_count"))
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the index has been built from the whole table with the current tokenizer"""
+        with self._lock:
+            return bool(self._meta("built")) and self._meta("tokenizer") == TOKENIZER_VERSION
+
+    def ensure_loaded(self, build: Callable[[], Any], table_count: Optional[Callable[[], int]] = None,
+                      max_age: Optional[float] = None):
+        """Call build() unless the index is built and in step with the table.
+
+        table_count, when given, returns the table's item count. It is compared
+        with the index on first use in the process and again once max_age
+        seconds have passed, and a mismatch (writes by a process that does not
+        keep this index, such as the Java Lambdas) rebuilds it. Concurrent
+        callers wait for that one check or build.
+        """
+        if self._current(table_count, max_age):
+            return
+        with self._build_lock:
+            if self._current(table_count, max_age):
+                return
+            if self.loaded and table_count is not None and table_count() == len(self):
+                self.checked_at = time.monotonic()
+            else:
+                build()
+
+    def _current(self, table_count: Optional[Callable[[], int]], max_age: Optional[float]) -> bool:
+        if not self.loaded:
+            return False
+        if table_count is None:
+            return True
+        return self.checked_at is not None and (max_age is None or time.monotonic() - self.checked_at < max_age)
+
+    def build(self, items: Iterable[Dict[str, Any]]):
+        """Replace the contents with EMBEDDINGS items (id, source, page, content, metadata)"""
+        with self._lock:
+            self._clear()
+            for item in items:
+                self._insert(item["id"], item.get("content", ""), item.get("source", ""),
+                             item.get("page", 0), item.get("metadata", "{}"))
+            self._set_meta("built", 1)
+            self._set_meta("tokenizer", TOKENIZER_VERSION)
+            self._conn.commit()
+            self.checked_at = time.monotonic()
+
+    def add(self, ids: List[str], documents: List[Document]):
+        """Insert or replace documents"""
+        # The last document for a repeated ID wins, as in bulk_add_documents
+        latest = dict(zip(ids, documents))
+        with self._lock:
+            self._delete(list(latest))
+            for doc_id, doc in latest.items():
+                self._insert(doc_id, doc.page_content, doc.metadata.get("source", ""),
+                             doc.metadata.get("page", 0), json.dumps(doc.metadata))
+            self._conn.commit()
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            self._delete(list(ids))
+            self._conn.commit()
+
+    def remove_source(self, source: str):
+        """Drop every document that came from a source file"""
+        with self._lock:
+            ids = [row[0] for row in self._conn.execute("SELECT doc_id FROM docs WHERE source = ?", (source,))]
+            self._delete(ids)
+            self._conn.commit()
+
+    def clear(self):
+        """Empty the index once the table is empty, which is fully indexed, so it stays marked as built"""
+        with self._lock:
+            self._clear()
+            self._set_meta("built", 1)
+            self._set_meta("tokenizer", TOKENIZER_VERSION)
+            self._conn.commit()
+
+    def invalidate(self):
+        """Mark the index as out of step with the table so the next search rebuilds it"""
+        with self._lock:
+            self._set_meta("built", 0)
+            self._conn.commit()
+
+    def search(self, query: str, k: int = 5, search_filter: Optional[SearchFilter] = None) -> List[Tuple[str, float]]:
+        """(document ID, BM25 score) of the k best matches for a query, best first"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or k <= 0:
+            return []
+
+        with self._lock:
+            doc_count = self._meta("doc_count")
+            if not doc_count:
+                return []
+            average_length = self._meta("total_length") / doc_count
+            postings = self._select("SELECT term, doc_id, tf FROM postings WHERE term IN ({})", terms)
+            if not postings:
+                return []
+            candidates = list(dict.fromkeys(doc_id for _, doc_id, _ in postings))
+            docs = {row[0]: row[1:] for row in self._select(
+                "SELECT doc_id, source, page, length, metadata FROM docs WHERE doc_id IN ({})", candidates)}
+
+        # Document frequencies count every match, not just those the filter keeps
+        document_frequency = Counter(term for term, _, _ in postings)
+        if search_filter is not None:
+            allowed = {doc_id for doc_id, (source, page, _, metadata) in docs.items()
+                       if search_filter.matches(source, page, metadata)}
+            postings = [posting for posting in postings if posting[1] in allowed]
+            candidates = [doc_id for doc_id in candidates if doc_id in allowed]
+            if not candidates:
+                return []
+
+        # Score every (term, document) posting at once and sum per document
+        row_of = {doc_id: row for row, doc_id in enumerate(candidates)}
+        rows = np.fromiter((row_of[doc_id] for _, doc_id, _ in postings), dtype=np.int64, count=len(postings))
+        tf = np.fromiter((count for _, _, count in postings), dtype=np.float64, count=len(postings))
+        idf = np.fromiter((math.log(1 + (doc_count - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                           for term, _, _ in postings), dtype=np.float64, count=len(postings))
+        lengths = np.fromiter((docs[doc_id][2] for _, doc_id, _ in postings), dtype=np.float64, count=len(postings))
+        contributions = idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * lengths / average_length))
+        scores = np.zeros(len(candidates), dtype=np.float64)
+        np.add.at(scores, rows, contributions)
+
+        return [(candidates[i], float(scores[i])) for i in top_k(scores, k)]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _insert(self, doc_id: str, content: str, source: str, page: Any, metadata: str):
+        counts = Counter(tokenize(content))
+        length = sum(counts.values())
+        self._conn.execute("INSERT INTO docs VALUES (?, ?, ?, ?, ?)",
+                           (doc_id, source, int(page or 0), length, metadata or "{}"))
+        self._conn.executemany("INSERT INTO postings VALUES (?, ?, ?)",
+                               [(term, doc_id, tf) for term, tf in counts.items()])
+        self._add_meta("doc_count", 1)
+        self._add_meta("total_length", length)
+
+    def _delete(self, ids: List[str]):
+        existing = self._select("SELECT doc_id, length FROM docs WHERE doc_id IN ({})", ids)
+        if not existing:
+            return
+        found = [doc_id for doc_id, _ in existing]
+        for start in range(0, len(found), 500):
+            chunk = found[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            self._conn.execute(f"DELETE FROM postings WHERE doc_id IN ({placeholders})", chunk)
+            self._conn.execute(f"DELETE FROM docs WHERE doc_id IN ({placeholders})", chunk)
+        self._add_meta("doc_count", -len(found))
+        self._add_meta("total_length", -sum(length for _, length in existing))
+
+    def _clear(self):
+        self._conn.execute("DELETE FROM postings")
+        self._conn.execute("DELETE FROM docs")
+        self._conn.execute("DELETE FROM meta")
+
+    def _select(self, sql: str, values: List[str]) -> List[tuple]:
+        # SQLite limits bound parameters, so look values up in chunks
+        rows = []
+        for start in range(0, len(values), 500):
+            chunk = values[start:start + 500]
+            rows.extend(self._conn.execute(sql.format(",".join("?" * len(chunk))), chunk).fetchall())
+        return rows
+
+    def _meta(self, key: str) -> float:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0.0
+
+    def _set_meta(self, key: str, value: float):
+        self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    def _add_meta(self, key: str, delta: float):
+        self._conn.execute("INSERT INTO meta VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = value + ?",
+                           (key, delta, delta))
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse ranked ID lists: each ID scores the sum of 1 / (k + rank) over the lists it appears in"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda entry: -entry[1])
+
+
+# One index per path shared by every store in the process
+_shared_indexes: Dict[str, BM25Index] = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_lexical_index(path: str) -> BM25Index:
+    with _shared_lock:
+        path = os.path.abspath(path)
+        if path not in _shared_indexes:
+            _shared_indexes[path] = BM25Index(path)
+        return _shared_indexes[path]
@@ -1,135 +1,815 @@
-import boto3
 import json
+import random
+import time
 import uuid
-from typing import List, Dict, Any, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Tuple
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 import numpy as np
-from decimal import Decimal
+from RAG.vector_codec import VECTOR_VERSIONS, encode_vector, decode_vector, vector_format_of
+from RAG.vector_index import (QUANTIZATIONS, QUERY_BLOCK, VectorIndex, get_shared_index, find_shared_indexes,
+                              item_document, mmr, top_k)
+from RAG.scan import scan_items, query_items, count_items
+from RAG.schema import SOURCE_INDEX, embeddings_table_definition
+from RAG.search_filter import SearchFilter
+from RAG.ann_index import IVFIndex, get_shared_ann_index
+from RAG.bm25_index import BM25Index, get_shared_lexical_index, reciprocal_rank_fusion
+from RAG.resources import get_registry
+from RAG import telemetry
+
+# Search scans read only what scoring needs; content and metadata are fetched for the winners
+SEARCH_PROJECTION = 'id, vector, vector_version'
+CONTENT_PROJECTION = 'id, content, metadata'
+
+# BatchGetItem accepts at most 100 keys per call
+BATCH_GET_SIZE = 100
+
+# Deleted items are flushed to BatchWriteItem, and migrated ones updated, in groups of this size
+MIGRATION_FLUSH_SIZE = 500
+
+# BatchWriteItem accepts at most 25 put/delete requests per call
+BATCH_WRITE_SIZE = 25
+
+# Errors worth retrying a whole batch for; anything else fails the batch
+RETRYABLE_ERRORS = {
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+    'InternalServerError',
+    'ServiceUnavailable',
+}
+
+
+@dataclass
+class BulkWriteReport:
+    """Per-ID outcome of a bulk write"""
+    succeeded: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
 
 class DynamoDBVectorStore:
     """DynamoDB-based vector store for RAG system"""
     
-    def __init__(self, table_name: str = "EMBEDDINGS", local: bool = True):
+    def __init__(self, table_name: str = "EMBEDDINGS", local: bool = True,
+                 max_workers: int = 8, max_retries: int = 8, vector_format: str = 'list',
+                 in_memory_index: bool = False, scan_segments: int = 4,
+                 ann_index_path: Optional[str] = None, ann_nprobe: int = 8,
+                 quantization: Optional[str] = None, rerank_factor: int = 4,
+                 max_pool_connections: Optional[int] = None, lexical_index_path: Optional[str] = None,
+                 index_ttl: Optional[float] = None):
+        # 'list' keeps vectors readable by the Java Lambdas; 'float32'/'float16'
+        # store them as a packed Binary attribute 4-8x smaller
+        if vector_format not in VECTOR_VERSIONS:
+            raise ValueError(f"Unknown vector format '{vector_format}', expected one of {list(VECTOR_VERSIONS)}")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization '{quantization}', expected one of {list(QUANTIZATIONS)}")
         self.table_name = table_name
+        self.local = local
+        self.vector_format = vector_format
+        # Searches go to a resident matrix loaded once per process instead of scanning
+        self.in_memory_index = in_memory_index or quantization is not None
+        # Writes through this process update the index directly; writes by other
+        # processes (populate_database, the Java Lambdas) are only picked up by
+        # reloading it, which happens once it is index_ttl seconds old
+        self.index_ttl = index_ttl
+        # 'int8' keeps the resident matrix as int8 codes and reranks the top
+        # k * rerank_factor candidates with full-precision vectors fetched by ID
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        # Full-table reads are split into this many parallel Scan segments
+        self.scan_segments = scan_segments
+        # Directory of the IVF index used by similarity_search_with_score(exact=False);
+        # writes through a store with the path keep a saved index there up to date
+        self.ann_index_path = ann_index_path
+        self.ann_nprobe = ann_nprobe
+        # SQLite file of the BM25 index over content used by hybrid_search_with_score
+        self.lexical_index_path = lexical_index_path
+        self.max_workers = max_workers
+        self.max_retries = max_retries
         
-        if local:
-            # Use DynamoDB Local
-            self.dynamodb = boto3.resource(
-                'dynamodb',
-                endpoint_url='http://localhost:8000',
-                region_name='us-east-1',
-                aws_access_key_id='fake',
-                aws_secret_access_key='fake'
-            )
-        else:
-            # Use AWS DynamoDB
-            self.dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-            
+        # DynamoDB Local or AWS DynamoDB; the resource and its connection pool
+        # are shared by every store in the process
+        self.dynamodb = get_registry().resource('dynamodb', local=local, max_pool_connections=max_pool_connections)
+
         self.table = self.dynamodb.Table(table_name)
         
     def add_documents(self, documents: List[Document], embeddings: List[List[float]], ids: Optional[List[str]] = None) -> List[str]:
         """Add documents with their embeddings to DynamoDB"""
         if ids is None:
             ids = [str(uuid.uuid4()) for _ in documents]
-            
-        for i, (doc, embedding, doc_id) in enumerate(zip(documents, embeddings, ids)):
-            item = {
-                'id': doc_id,
-                'content': doc.page_content,
-                'vector': [Decimal(str(x)) for x in embedding],
-                'source': doc.metadata.get('source', ''),
-                'page': doc.metadata.get('page', 0),
-                'metadata': json.dumps(doc.metadata)
-            }
-            
+
+        report = self.bulk_add_documents(documents, embeddings, ids)
+        for doc_id, error in report.failed.items():
+            print(f"Error adding document {doc_id}: {error}")
+
+        return ids
+
+    def bulk_add_documents(self, documents: List[Document], embeddings: List[List[float]], ids: Optional[List[str]] = None) -> BulkWriteReport:
+        """Write documents in concurrent 25-item BatchWriteItem calls and report the outcome per ID"""
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in documents]
+
+        # A batch may not contain the same key twice, so the last write for an ID wins
+        items = {}
+        for doc, embedding, doc_id in zip(documents, embeddings, ids):
+            items[doc_id] = self._build_item(doc, embedding, doc_id)
+
+        requests = [{'PutRequest': {'Item': item}} for item in items.values()]
+        with telemetry.span("vector_store.write", items=len(requests)):
+            report = self._batch_write(requests)
+
+        if report.succeeded:
+            written = set(report.succeeded)
+            rows = [(doc_id, embedding, doc) for doc, embedding, doc_id in zip(documents, embeddings, ids) if doc_id in written]
+            self._index_add([r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows])
+
+        return report
+
+    def _build_item(self, doc: Document, embedding: List[float], doc_id: str) -> Dict[str, Any]:
+        """Build the DynamoDB item for one chunk"""
+        vector, version = encode_vector(embedding, self.vector_format)
+        return {
+            'id': doc_id,
+            'content': doc.page_content,
+            'vector': vector,
+            'vector_version': version,
+            'source': doc.metadata.get('source', ''),
+            'page': doc.metadata.get('page', 0),
+            'metadata': json.dumps(doc.metadata)
+        }
+
+    def _batch_write(self, requests: List[Dict[str, Any]]) -> BulkWriteReport:
+        """Send put/delete requests as 25-item batches spread over a worker pool"""
+        report = BulkWriteReport()
+        batches = [requests[i:i + BATCH_WRITE_SIZE] for i in range(0, len(requests), BATCH_WRITE_SIZE)]
+        if not batches:
+            return report
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+            for succeeded, failed in executor.map(telemetry.propagate(self._write_batch), batches):
+                report.succeeded.extend(succeeded)
+                report.failed.update(failed)
+
+        return report
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> Tuple[List[str], Dict[str, str]]:
+        """Write one batch, retrying UnprocessedItems with jittered exponential backoff"""
+        # The resource's client is thread-safe and accepts plain Python types
+        client = self.dynamodb.meta.client
+        succeeded: List[str] = []
+        failed: Dict[str, str] = {}
+        pending = batch
+        attempt = 0
+
+        while pending:
             try:
-                self.table.put_item(Item=item)
+                response = client.batch_write_item(RequestItems={self.table_name: pending})
+                unprocessed = response.get('UnprocessedItems', {}).get(self.table_name, [])
+            except ClientError as e:
+                code = e.response['Error']['Code']
+                if code not in RETRYABLE_ERRORS:
+                    failed.update({self._request_id(r): str(e) for r in pending})
+                    break
+                unprocessed = pending
             except Exception as e:
-                print(f"Error adding document {doc_id}: {e}")
-                
-        return ids
+                failed.update({self._request_id(r): str(e) for r in pending})
+                break
+
+            unprocessed_ids = {self._request_id(r) for r in unprocessed}
+            succeeded.extend(self._request_id(r) for r in pending if self._request_id(r) not in unprocessed_ids)
+
+            if unprocessed:
+                attempt += 1
+                if attempt > self.max_retries:
+                    failed.update({doc_id: f"still unprocessed after {self.max_retries} retries" for doc_id in unprocessed_ids})
+                    break
+                time.sleep(self._backoff(attempt))
+            pending = unprocessed
+
+        return succeeded, failed
+
+    @staticmethod
+    def _request_id(request: Dict[str, Any]) -> str:
+        """Extract the document ID from a BatchWriteItem put/delete request"""
+        if 'PutRequest' in request:
+            return request['PutRequest']['Item']['id']
+        return request['DeleteRequest']['Key']['id']
+
+    @staticmethod
+    def _backoff(attempt: int, base: float = 0.05, cap: float = 5.0) -> float:
+        """Full-jitter exponential backoff delay in seconds"""
+        return random.uniform(0, min(cap, base * (2 ** attempt)))
     
-    def similarity_search_with_score(self, query_embedding: List[float], k: int = 5) -> List[Tuple[Document, float]]:
-        """Find similar documents using cosine similarity"""
-        try:
-            # Scan all items (Note: This is not efficient for large datasets)
-            response = self.table.scan()
-            items = response['Items']
-            
-            # Calculate similarities
-            similarities = []
-            for item in items:
-                # Convert Decimal back to float for similarity calculation
-                vector = [float(x) for x in item['vector']]
-                similarity = self._cosine_similarity(query_embedding, vector)
-                doc = Document(
-                    page_content=item['content'],
-                    metadata=json.loads(item.get('metadata', '{}'))
-                )
-                similarities.append((doc, similarity))
-            
-            # Sort by similarity and return top k
-            similarities.sort(key=lambda x: x[1], reverse=True)
-            return similarities[:k]
-            
-        except Exception as e:
-            print(f"Error in similarity search: {e}")
+    def similarity_search_with_score(self, query_embedding: List[float], k: int = 5, exact: bool = True,
+                                     search_filter: Optional[SearchFilter] = None) -> List[Tuple[Document, float]]:
+        """Find similar documents using cosine similarity.
+
+        exact=False searches the IVF index at ann_index_path (built on first use)
+        instead of scoring every vector; without an index path it has no effect.
+        A search_filter always uses exact search; when it names sources only
+        those sources are read, through Source-Index queries.
+        """
+        with telemetry.span("vector_store.search", k=k) as search_span:
+            if not exact and self.ann_index_path and search_filter is None:
+                search_span.attributes["path"] = "ann"
+                try:
+                    return self._ann_search(query_embedding, k)
+                except Exception as e:
+                    print(f"Error in approximate similarity search: {e}")
+                    return []
+
+            if self._index_can_filter(search_filter):
+                search_span.attributes["path"] = "index"
+                try:
+                    return self._load_index().search(query_embedding, k, fetch_vectors=self._fetch_vectors,
+                                                     rerank_factor=self.rerank_factor, search_filter=search_filter,
+                                                     fetch_documents=self._documents_batch)
+                except Exception as e:
+                    print(f"Error in similarity search: {e}")
+                    return []
+
+            search_span.attributes["path"] = "scan"
+            try:
+                if search_filter is None:
+                    # Scan all items (Note: This is not efficient for large datasets)
+                    items = self._scan(ProjectionExpression=SEARCH_PROJECTION)
+                else:
+                    items = (item for item in self._filter_source_items(search_filter, self._filter_projection(search_filter))
+                             if search_filter.matches(item.get('source', ''), item.get('page', 0), item.get('metadata')))
+                return self._documents(self._rank_items(query_embedding, items, k))
+
+            except Exception as e:
+                print(f"Error in similarity search: {e}")
+                return []
+
+    def similarity_search_batch(self, query_embeddings: List[List[float]], k: int = 5,
+                                search_filter: Optional[SearchFilter] = None) -> List[List[Tuple[Document, float]]]:
+        """Top k documents for each of many queries, in query order.
+
+        The table (or the in-memory index) is read once and every query is
+        scored by one matrix-matrix product, so evaluating hundreds of
+        questions costs one scan instead of hundreds. Search is always exact.
+        """
+        if not query_embeddings:
             return []
-    
-    def similarity_search(self, query_embedding: List[float], k: int = 5) -> List[Document]:
+        with telemetry.span("vector_store.search_batch", k=k, queries=len(query_embeddings)) as search_span:
+            if self._index_can_filter(search_filter):
+                search_span.attributes["path"] = "index"
+                try:
+                    return self._load_index().search_batch(query_embeddings, k, fetch_vectors=self._fetch_vectors,
+                                                           rerank_factor=self.rerank_factor, search_filter=search_filter,
+                                                           fetch_documents=self._documents_batch)
+                except Exception as e:
+                    print(f"Error in batch similarity search: {e}")
+                    return [[] for _ in query_embeddings]
+
+            search_span.attributes["path"] = "scan"
+            try:
+                if search_filter is None:
+                    items = self._scan(ProjectionExpression=SEARCH_PROJECTION)
+                else:
+                    items = (item for item in self._filter_source_items(search_filter, self._filter_projection(search_filter))
+                             if search_filter.matches(item.get('source', ''), item.get('page', 0), item.get('metadata')))
+                return self._documents_batch(self._rank_items_batch(query_embeddings, items, k))
+            except Exception as e:
+                print(f"Error in batch similarity search: {e}")
+                return [[] for _ in query_embeddings]
+
+    def hybrid_search_with_score(self, query_text: str, query_embedding: List[float], k: int = 5,
+                                 search_filter: Optional[SearchFilter] = None, fetch_k: Optional[int] = None,
+                                 rrf_k: int = 60) -> List[Tuple[Document, float]]:
+        """Fuse vector and BM25 rankings with reciprocal rank fusion.
+
+        Each side ranks fetch_k candidates (4 * k by default), so exact terms
+        such as clause numbers, names and amounts reach the top k even when
+        their embeddings are not the closest. Scores are fused RRF scores.
+        Needs lexical_index_path; the index is built from the table on first use.
+        If the lexical side fails the top k vector hits are returned, with
+        their cosine scores.
+        """
+        if not self.lexical_index_path:
+            raise ValueError("lexical_index_path is not set")
+        fetch_k = fetch_k or 4 * k
+
+        with telemetry.span("vector_store.hybrid_search", k=k):
+            vector_hits = self.similarity_search_with_score(query_embedding, fetch_k, search_filter=search_filter)
+            try:
+                return self._fuse(query_text, vector_hits, k, search_filter, fetch_k, rrf_k)
+            except Exception as e:
+                print(f"Error in lexical search, using vector results only: {e}")
+                return vector_hits[:k]
+
+    def hybrid_search_batch(self, query_texts: List[str], query_embeddings: List[List[float]], k: int = 5,
+                            search_filter: Optional[SearchFilter] = None, fetch_k: Optional[int] = None,
+                            rrf_k: int = 60) -> List[List[Tuple[Document, float]]]:
+        """hybrid_search_with_score for many queries, with one batched vector search"""
+        if not self.lexical_index_path:
+            raise ValueError("lexical_index_path is not set")
+        fetch_k = fetch_k or 4 * k
+
+        with telemetry.span("vector_store.hybrid_search_batch", k=k, queries=len(query_texts)):
+            vector_hits = self.similarity_search_batch(query_embeddings, fetch_k, search_filter=search_filter)
+            try:
+                return [self._fuse(query_text, hits, k, search_filter, fetch_k, rrf_k)
+                        for query_text, hits in zip(query_texts, vector_hits)]
+            except Exception as e:
+                print(f"Error in batch lexical search, using vector results only: {e}")
+                return [hits[:k] for hits in vector_hits]
+
+    def _fuse(self, query_text: str, vector_hits: List[Tuple[Document, float]], k: int,
+              search_filter: Optional[SearchFilter], fetch_k: int, rrf_k: int) -> List[Tuple[Document, float]]:
+        with telemetry.span("vector_store.lexical_search"):
+            lexical_hits = self._lexical_index().search(query_text, fetch_k, search_filter)
+
+        # Chunks are matched across the two rankings by their item ID, which item_document puts in the metadata
+        documents = {doc.metadata['id']: doc for doc, _ in vector_hits}
+        fused = reciprocal_rank_fusion([list(documents), [doc_id for doc_id, _ in lexical_hits]], rrf_k)[:k]
+
+        missing = [doc_id for doc_id, _ in fused if doc_id not in documents]
+        if missing:
+            for doc_id, item in self._get_items(missing, ProjectionExpression=CONTENT_PROJECTION).items():
+                documents[doc_id] = item_document(doc_id, item['content'], item.get('metadata'))
+        return [(documents[doc_id], score) for doc_id, score in fused if doc_id in documents]
+
+    def max_marginal_relevance_search(self, query_embedding: List[float], k: int = 5, fetch_k: int = 20,
+                                      lambda_mult: float = 0.5,
+                                      search_filter: Optional[SearchFilter] = None) -> List[Tuple[Document, float]]:
+        """Top fetch_k by similarity, narrowed to k that do not repeat each other.
+
+        Overlapping neighbour chunks of one page tend to fill the plain top k;
+        lambda_mult trades relevance (1.0) against diversity (0.0).
+        """
+        candidates = self.similarity_search_with_score(query_embedding, fetch_k, search_filter=search_filter)
+        return self.diversify(query_embedding, candidates, k, lambda_mult)
+
+    def diversify(self, query_embedding: List[float], candidates: List[Tuple[Document, float]], k: int = 5,
+                  lambda_mult: float = 0.5, use_scores: bool = False) -> List[Tuple[Document, float]]:
+        """Pick k of the given results by maximal marginal relevance, keeping their scores.
+
+        Candidate vectors come from the in-memory index when loaded, else by
+        key from the table. With use_scores the candidates' own scores, scaled
+        to [0, 1], stand in for relevance (e.g. fused hybrid scores). Repeats
+        of a chunk ID keep only their first, best ranked, occurrence.
+        """
+        seen = set()
+        unique = []
+        for doc, score in candidates:
+            doc_id = doc.metadata.get('id')
+            if doc_id is None or doc_id not in seen:
+                seen.add(doc_id)
+                unique.append((doc, score))
+        candidates = unique
+        if len(candidates) <= k:
+            return candidates
+
+        with telemetry.span("vector_store.mmr", candidates=len(candidates), k=k):
+            ids = [doc.metadata.get('id') for doc, _ in candidates]
+            vectors = self._candidate_vectors([doc_id for doc_id in ids if doc_id])
+            dim = len(query_embedding)
+            # Chunks without a stored vector (e.g. Documents built elsewhere) count as unlike everything else
+            matrix = np.vstack([vectors.get(doc_id, np.zeros(dim, dtype=np.float32)) if doc_id else np.zeros(dim, dtype=np.float32)
+                                for doc_id in ids])
+            relevance = None
+            if use_scores:
+                scores = np.array([score for _, score in candidates], dtype=np.float32)
+                relevance = scores / scores.max() if scores.max() > 0 else scores
+            chosen = mmr(np.asarray(query_embedding, dtype=np.float32), matrix, k, lambda_mult, relevance)
+            return [candidates[i] for i in chosen]
+
+    def _index_can_filter(self, search_filter: Optional[SearchFilter]) -> bool:
+        """Whether a search goes to the in-memory index; a quantized one holds no metadata to filter on"""
+        return self.in_memory_index and get_shared_index(self.table_name, self.local, self.quantization).can_filter(search_filter)
+
+    def _candidate_vectors(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        vectors: Dict[str, np.ndarray] = {}
+        if self.in_memory_index:
+            vectors = get_shared_index(self.table_name, self.local, self.quantization).vectors(ids)
+        missing = [doc_id for doc_id in ids if doc_id not in vectors]
+        if missing:
+            vectors.update(self._fetch_vectors(missing))
+        return vectors
+
+    def similarity_search(self, query_embedding: List[float], k: int = 5,
+                          search_filter: Optional[SearchFilter] = None) -> List[Document]:
         """Find similar documents without scores"""
-        results = self.similarity_search_with_score(query_embedding, k)
+        results = self.similarity_search_with_score(query_embedding, k, search_filter=search_filter)
         return [doc for doc, _ in results]
+
+    def _filter_source_items(self, search_filter: SearchFilter,
+                             projection: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """Items a filter could match: Source-Index queries per source, else the whole table"""
+        projection = projection or {}
+        if search_filter.sources is None:
+            yield from self._scan(**projection)
+            return
+        if not search_filter.sources:
+            return
+
+        def query_source(source: str) -> List[Dict[str, Any]]:
+            return list(query_items(self.table, IndexName=SOURCE_INDEX,
+                                    KeyConditionExpression=Key('source').eq(source), **projection))
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(search_filter.sources))) as executor:
+            for items in executor.map(telemetry.propagate(query_source), search_filter.sources):
+                yield from items
+
+    @staticmethod
+    def _filter_projection(search_filter: SearchFilter) -> Dict[str, Any]:
+        """Attributes a filtered search has to read: the vector plus whatever the filter tests"""
+        attributes = [SEARCH_PROJECTION, '#s', '#p']
+        if search_filter.needs_metadata:
+            attributes.append('metadata')
+        return {
+            'ProjectionExpression': ', '.join(attributes),
+            'ExpressionAttributeNames': {'#s': 'source', '#p': 'page'},
+        }
+
+    def _rank_items(self, query_embedding: List[float], items: Iterable[Dict[str, Any]], k: int) -> List[Tuple[str, float]]:
+        """Score items with one matrix-vector product and return the top k (ID, score)"""
+        return self._rank_items_batch([query_embedding], items, k)[0]
+
+    def _rank_items_batch(self, query_embeddings: List[List[float]], items: Iterable[Dict[str, Any]],
+                          k: int) -> List[List[Tuple[str, float]]]:
+        """Score items against every query, QUERY_BLOCK queries per matrix-matrix product,
+        and return the top k (ID, score) of each"""
+        ids: List[str] = []
+        vectors: List[np.ndarray] = []
+        with telemetry.span("vector_store.scan") as scan_span:
+            for item in items:
+                # Decode list or packed binary vectors to float32; only the ID is kept of the rest
+                vectors.append(decode_vector(item))
+                ids.append(item['id'])
+            scan_span.attributes["items"] = len(ids)
+        if not ids or k <= 0:
+            return [[] for _ in query_embeddings]
+
+        with telemetry.span("vector_store.score", items=len(ids), queries=len(query_embeddings)):
+            matrix = np.vstack(vectors)
+            norms = np.linalg.norm(matrix, axis=1)
+            norms[norms == 0] = 1.0
+            matrix /= norms[:, None]
+            queries = np.asarray(query_embeddings, dtype=np.float32)
+            query_norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            query_norms[query_norms == 0] = 1.0
+            queries = queries / query_norms
+
+            ranked = []
+            for start in range(0, len(queries), QUERY_BLOCK):
+                scores = matrix @ queries[start:start + QUERY_BLOCK].T
+                for column in range(scores.shape[1]):
+                    ranked.append([(ids[i], float(scores[i, column])) for i in top_k(scores[:, column], k)])
+        return ranked
+
+    def _documents(self, hits: List[Tuple[str, float]]) -> List[Tuple[Document, float]]:
+        """Fetch content and metadata for ranked IDs and build their Documents, in rank order"""
+        return self._documents_batch([hits])[0]
+
+    def _documents_batch(self, rankings: List[List[Tuple[str, float]]]) -> List[List[Tuple[Document, float]]]:
+        """_documents for several rankings, reading each distinct ID once"""
+        wanted = list(dict.fromkeys(doc_id for hits in rankings for doc_id, _ in hits))
+        items = self._get_items(wanted, ProjectionExpression=CONTENT_PROJECTION)
+        return [[
+            (item_document(doc_id, items[doc_id]['content'], items[doc_id].get('metadata')), score)
+            for doc_id, score in hits if doc_id in items
+        ] for hits in rankings]
     
-    def delete_by_source(self, source: str):
-        """Delete all embeddings from a specific source"""
+    def delete_by_source(self, source: str) -> int:
+        """Delete all embeddings from a specific source and return how many were deleted"""
+        report = BulkWriteReport()
         try:
-            # Query by source using GSI
-            response = self.table.query(
-                IndexName='Source-Index',
-                KeyConditionExpression=boto3.dynamodb.conditions.Key('source').eq(source)
-            )
-            
-            # Delete each item
-            for item in response['Items']:
-                self.table.delete_item(Key={'id': item['id']})
-                
+            # Query every page of the source's keys using the GSI
+            keys = query_items(self.table, IndexName=SOURCE_INDEX, ProjectionExpression='id',
+                               KeyConditionExpression=Key('source').eq(source))
+            self._bulk_delete((item['id'] for item in keys), report)
         except Exception as e:
             print(f"Error deleting by source {source}: {e}")
+            # Drop only what is gone from the table, so the indexes keep the chunks that are left
+            self._index_remove(report.succeeded)
+        else:
+            if report.ok:
+                self._index_remove_source(source)
+            else:
+                self._index_remove(report.succeeded)
+        return len(report.succeeded)
     
-    def clear_all(self):
-        """Clear all embeddings from the table"""
+    def clear_all(self, truncate: bool = False) -> int:
+        """Clear all embeddings from the table and return how many were deleted.
+
+        truncate=True drops and recreates the table instead of deleting item by
+        item, which is much faster for large tables but briefly makes it unavailable.
+        """
+        if truncate:
+            try:
+                deleted = self._truncate()
+            except Exception as e:
+                print(f"Error clearing table: {e}")
+                # The table may or may not be empty now; reload the indexes on next use
+                self._index_invalidate()
+                return 0
+            self._index_clear()
+            return deleted
+
+        report = BulkWriteReport()
         try:
-            response = self.table.scan()
-            for item in response['Items']:
-                self.table.delete_item(Key={'id': item['id']})
+            self._bulk_delete((item['id'] for item in self._scan(ProjectionExpression='id')), report)
         except Exception as e:
             print(f"Error clearing table: {e}")
+            self._index_remove(report.succeeded)
+        else:
+            if report.ok:
+                self._index_clear()
+            else:
+                self._index_remove(report.succeeded)
+        return len(report.succeeded)
+
+    def _bulk_delete(self, ids: Iterable[str], report: BulkWriteReport):
+        """Delete keys as they are enumerated, in concurrent 25-item BatchWriteItem calls.
+
+        Outcomes are recorded in report as each group finishes, so a caller
+        still knows what was deleted if enumerating the keys fails midway.
+        """
+        requests = []
+        for doc_id in ids:
+            requests.append({'DeleteRequest': {'Key': {'id': doc_id}}})
+            if len(requests) >= MIGRATION_FLUSH_SIZE:
+                self._delete_requests(requests, report)
+                requests = []
+        if requests:
+            self._delete_requests(requests, report)
+
+    def _delete_requests(self, requests: List[Dict[str, Any]], report: BulkWriteReport):
+        flushed = self._batch_write(requests)
+        for doc_id, error in flushed.failed.items():
+            print(f"Error deleting document {doc_id}: {error}")
+        report.succeeded.extend(flushed.succeeded)
+        report.failed.update(flushed.failed)
+
+    def _truncate(self) -> int:
+        """Drop and recreate the table with the schema from scripts/create_tables.py"""
+        client = self.dynamodb.meta.client
+        count = count_items(self.table, total_segments=self.scan_segments)
+
+        client.delete_table(TableName=self.table_name)
+        client.get_waiter('table_not_exists').wait(TableName=self.table_name)
+        client.create_table(**embeddings_table_definition(self.table_name))
+        client.get_waiter('table_exists').wait(TableName=self.table_name)
+        return count
     
     def get_existing_ids(self) -> List[str]:
         """Get all existing document IDs"""
         try:
-            response = self.table.scan(ProjectionExpression='id')
-            return [item['id'] for item in response['Items']]
+            return [item['id'] for item in self._scan(ProjectionExpression='id')]
         except Exception as e:
             print(f"Error getting existing IDs: {e}")
             return []
     
-    def _cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
-        """Calculate cosine similarity between two vectors"""
+    def find_existing_ids(self, ids: List[str]) -> List[str]:
+        """Which of the candidate IDs are already stored, via keys-only BatchGetItem.
+
+        Costs reads proportional to the number of candidates, not the table size.
+        """
+        items = self._get_items(ids, ProjectionExpression='id')
+        return [doc_id for doc_id in dict.fromkeys(ids) if doc_id in items]
+
+    def refresh_index(self) -> VectorIndex:
+        """Reload the in-memory index from the table, e.g. after writes from another process.
+
+        Searches keep using the current rows during the scan.
+        """
+        index = get_shared_index(self.table_name, self.local, self.quantization)
+        with telemetry.span("vector_store.index_load") as load_span:
+            if index.keeps_payloads:
+                index.load(self._scan())
+            else:
+                # Content and metadata are fetched by key for results, so don't read them
+                index.load(self._scan(ProjectionExpression='id, #s, page, vector, vector_version',
+                                      ExpressionAttributeNames={'#s': 'source'}))
+            load_span.attributes["items"] = len(index)
+        return index
+
+    def warm_index(self):
+        """Load whichever search index this store uses so the first query does not pay for it"""
+        if self.in_memory_index:
+            self._load_index()
+        if self.ann_index_path:
+            self._ann_index()
+        if self.lexical_index_path:
+            self._lexical_index()
+
+    def _load_index(self) -> VectorIndex:
+        """Return the shared in-memory index, scanning the table the first time"""
+        index = get_shared_index(self.table_name, self.local, self.quantization)
+        # Concurrent first searches wait for one scan instead of each starting their own
+        try:
+            index.ensure_loaded(self.refresh_index, max_age=self.index_ttl)
+        except Exception as e:
+            if not index.loaded:
+                raise
+            # A failed reload keeps the previous rows, which are better than no results
+            print(f"Error reloading the in-memory index: {e}")
+        return index
+
+    def build_ann_index(self, nlist: Optional[int] = None) -> IVFIndex:
+        """(Re)build the IVF index from the table and save it to ann_index_path"""
+        if not self.ann_index_path:
+            raise ValueError("ann_index_path is not set")
+        index = get_shared_ann_index(self.ann_index_path, self.ann_nprobe)
+        index.build(self._scan(ProjectionExpression='id, #s, vector, vector_version',
+                               ExpressionAttributeNames={'#s': 'source'}), nlist=nlist)
+        return index
+
+    def _ann_search(self, query_embedding: List[float], k: int) -> List[Tuple[Document, float]]:
+        """Approximate top k from the IVF index, then fetch the winning items by key"""
+        return self._documents(self._ann_index().search(query_embedding, k))
+
+    def _ann_index(self) -> IVFIndex:
+        index = get_shared_ann_index(self.ann_index_path, self.ann_nprobe)
+        # Writers without ann_index_path don't update it, so compare it with the table's item count
+        index.ensure_loaded(self.build_ann_index, max_age=self.index_ttl,
+                            table_count=lambda: count_items(self.table, total_segments=self.scan_segments))
+        return index
+
+    def build_lexical_index(self) -> BM25Index:
+        """(Re)build the BM25 index from the table and save it to lexical_index_path"""
+        if not self.lexical_index_path:
+            raise ValueError("lexical_index_path is not set")
+        index = get_shared_lexical_index(self.lexical_index_path)
+        index.build(self._scan(ProjectionExpression='id, #s, page, content, metadata',
+                               ExpressionAttributeNames={'#s': 'source'}))
+        return index
+
+    def _lexical_index(self) -> BM25Index:
+        index = get_shared_lexical_index(self.lexical_index_path)
+        # Other writers don't update the file, so compare it with the table's item count
+        index.ensure_loaded(self.build_lexical_index, max_age=self.index_ttl,
+                            table_count=lambda: count_items(self.table, total_segments=self.scan_segments))
+        return index
+
+    def _get_items(self, ids: List[str], **get_kwargs) -> Dict[str, Dict[str, Any]]:
+        """Fetch items by ID with concurrent 100-key BatchGetItem calls"""
+        ids = list(dict.fromkeys(ids))
+        batches = [ids[i:i + BATCH_GET_SIZE] for i in range(0, len(ids), BATCH_GET_SIZE)]
+        items: Dict[str, Dict[str, Any]] = {}
+        if not batches:
+            return items
+
+        with telemetry.span("vector_store.batch_get", items=len(ids)), \
+                ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+            get_batch = telemetry.propagate(lambda batch: self._get_batch(batch, get_kwargs))
+            for batch_items in executor.map(get_batch, batches):
+                items.update((item['id'], item) for item in batch_items)
+        return items
+
+    def _get_batch(self, batch: List[str], get_kwargs: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Fetch one batch of keys, retrying UnprocessedKeys with backoff"""
+        client = self.dynamodb.meta.client
+        request = dict(get_kwargs, Keys=[{'id': doc_id} for doc_id in batch])
+        found: List[Dict[str, Any]] = []
+        attempt = 0
+
+        while request['Keys']:
+            response = client.batch_get_item(RequestItems={self.table_name: request})
+            found.extend(response.get('Responses', {}).get(self.table_name, []))
+            unprocessed = response.get('UnprocessedKeys', {}).get(self.table_name)
+            if not unprocessed:
+                break
+            attempt += 1
+            if attempt > self.max_retries:
+                raise RuntimeError(f"{len(unprocessed['Keys'])} keys still unprocessed after {self.max_retries} retries")
+            time.sleep(self._backoff(attempt))
+            request = unprocessed
+
+        return found
+
+    def _fetch_vectors(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        """Full-precision vectors for a rerank shortlist"""
+        items = self._get_items(ids, ProjectionExpression='id, vector, vector_version')
+        return {doc_id: decode_vector(item) for doc_id, item in items.items()}
+
+    def _index_add(self, ids: List[str], embeddings: List[List[float]], documents: List[Document]):
+        """Apply freshly written documents to any loaded in-process index"""
+        sources = [doc.metadata.get('source', '') for doc in documents]
+        self._update_indexes(lambda index: index.add(ids, embeddings, documents),
+                             ann_update=lambda index: index.add(ids, embeddings, sources),
+                             lexical_update=lambda index: index.add(ids, documents))
+
+    def _index_remove(self, ids: List[str]):
+        if not ids:
+            return
+        self._update_indexes(lambda index: index.remove(ids))
+
+    def _index_remove_source(self, source: str):
+        self._update_indexes(lambda index: index.remove_source(source))
+
+    def _index_clear(self):
+        self._update_indexes(lambda index: index.clear())
+
+    def _update_indexes(self, update: Callable[[Any], None], ann_update: Optional[Callable[[IVFIndex], None]] = None,
+                        lexical_update: Optional[Callable[[BM25Index], None]] = None):
+        """Apply a change that already reached the table to every index this store keeps.
+
+        An index that fails to take it is invalidated, so it is rebuilt on next
+        use, rather than failing a write that succeeded.
+        """
+        indexes = [(index, update) for index in find_shared_indexes(self.table_name, self.local)]
+        if self.ann_index_path:
+            try:
+                ann = get_shared_ann_index(self.ann_index_path, self.ann_nprobe)
+            except Exception as e:
+                print(f"Error loading IVF index {self.ann_index_path}: {e}")
+            else:
+                if ann.loaded:
+                    indexes.append((ann, ann_update or update))
+        if self.lexical_index_path:
+            indexes.append((get_shared_lexical_index(self.lexical_index_path), lexical_update or update))
+
+        for index, apply in indexes:
+            try:
+                apply(index)
+            except Exception as e:
+                print(f"Error updating {type(index).__name__}, rebuilding it on next use: {e}")
+                try:
+                    index.invalidate()
+                except Exception as e:
+                    print(f"Error invalidating {type(index).__name__}: {e}")
+
+    def _index_invalidate(self):
+        """Mark every index as out of step with the table so it is rebuilt on next use"""
+        for index in find_shared_indexes(self.table_name, self.local):
+            index.invalidate()
+        if self.ann_index_path:
+            get_shared_ann_index(self.ann_index_path, self.ann_nprobe).invalidate()
+        if self.lexical_index_path:
+            get_shared_lexical_index(self.lexical_index_path).invalidate()
+
+    def migrate_vectors(self, vector_format: Optional[str] = None) -> BulkWriteReport:
+        """Rewrite every item whose vector is not yet in the target format.
+
+        Only vector and vector_version are updated, and only if both still hold
+        what the scan read, so a chunk rewritten meanwhile by another writer is
+        left alone (and reported as failed) instead of being reverted.
+        """
+        target = vector_format or self.vector_format
+        if target not in VECTOR_VERSIONS:
+            raise ValueError(f"Unknown vector format '{target}', expected one of {list(VECTOR_VERSIONS)}")
+
+        report = BulkWriteReport()
+        pending = []
+
+        def flush():
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for doc_id, error in executor.map(telemetry.propagate(lambda item: self._migrate_item(item, target)), pending):
+                    if error is None:
+                        report.succeeded.append(doc_id)
+                    else:
+                        report.failed[doc_id] = error
+            pending.clear()
+
+        for item in self._scan(ProjectionExpression='id, vector, vector_version'):
+            if vector_format_of(item) == target:
+                continue
+            pending.append(item)
+            if len(pending) >= MIGRATION_FLUSH_SIZE:
+                flush()
+        if pending:
+            flush()
+
+        return report
+
+    def _migrate_item(self, item: Dict[str, Any], target: str) -> Tuple[str, Optional[str]]:
+        """Conditionally re-encode one item's vector; returns its ID and an error, if any"""
+        vector, version = encode_vector(decode_vector(item).tolist(), target)
+        values = {':vector': vector, ':version': version, ':old_vector': item['vector']}
+        if 'vector_version' in item:
+            condition = '#vv = :old_version AND #v = :old_vector'
+            values[':old_version'] = item['vector_version']
+        else:
+            # Items from before vector_version existed
+            condition = 'attribute_exists(id) AND attribute_not_exists(#vv) AND #v = :old_vector'
         try:
-            vec1 = np.array(vec1)
-            vec2 = np.array(vec2)
-            
-            dot_product = np.dot(vec1, vec2)
-            norm1 = np.linalg.norm(vec1)
-            norm2 = np.linalg.norm(vec2)
-            
-            if norm1 == 0 or norm2 == 0:
-                return 0.0
-                
-            return dot_product / (norm1 * norm2)
+            self.table.update_item(
+                Key={'id': item['id']},
+                UpdateExpression='SET #v = :vector, #vv = :version',
+                ConditionExpression=condition,
+                ExpressionAttributeNames={'#v': 'vector', '#vv': 'vector_version'},
+                ExpressionAttributeValues=values,
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return item['id'], "changed or deleted during the migration; run it again to migrate it"
+            return item['id'], str(e)
         except Exception as e:
-            print(f"Error calculating cosine similarity: {e}")
-            return 0.0
\ No newline at end of file
+            return item['id'], str(e)
+        return item['id'], None
+
+    def _scan(self, **scan_kwargs) -> Iterator[Dict[str, Any]]:
+        """Stream the whole table through the paginated, segmented scan engine"""
+        return scan_items(self.table, total_segments=self.scan_segments, **scan_kwargs)
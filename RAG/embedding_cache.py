@@ -0,0 +1,218 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from RAG.telemetry import metric, propagate
+
+
+def normalize_query(text: str) -> str:
+    """Canonical form of a question: NFC, trimmed, runs of whitespace collapsed"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def text_hash(text: str) -> str:
+    """SHA-256 hex digest of a text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """SQLite file mapping (model, key) to a float32 vector; survives restarts"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, key))"
+            )
+            self._conn.commit()
+
+    def get_many(self, model: str, keys: List[str]) -> Dict[str, List[float]]:
+        """Vectors for whichever keys are stored"""
+        found: Dict[str, List[float]] = {}
+        # SQLite limits bound parameters, so look keys up in chunks
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({placeholders})",
+                    [model, *chunk],
+                ).fetchall()
+            for key, vector in rows:
+                found[key] = np.frombuffer(vector, dtype="<f4").tolist()
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, List[float]]):
+        """Store vectors, replacing existing ones"""
+        rows = [(model, key, np.asarray(vector, dtype="<f4").tobytes()) for key, vector in vectors.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that avoids recomputing vectors.
+
+    embed_query goes through a bounded LRU and then the optional disk store;
+    embed_queries does the same for many questions with one disk lookup.
+    embed_documents looks chunks up in the disk store by SHA-256 of their exact
+    text and only sends the misses to the wrapped embedding function.
+    """
+
+    def __init__(self, embeddings: Embeddings, model: str, max_entries: int = 1024,
+                 store: Optional[EmbeddingStore] = None):
+        self.embeddings = embeddings
+        self.model = model
+        self.max_entries = max_entries
+        self.store = store
+        self._lru: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.document_hits = 0
+        self.document_misses = 0
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters for the query and document caches"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "entries": len(self._lru),
+                "document_hits": self.document_hits,
+                "document_misses": self.document_misses,
+            }
+
+    def embed_query(self, text: str) -> List[float]:
+        key = f"query:{text_hash(normalize_query(text))}"
+
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                metric("embedding_cache.query_hits", tier="memory")
+                return self._lru[key]
+
+        if self.store is not None:
+            stored = self.store.get_many(self.model, [key]).get(key)
+            if stored is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                metric("embedding_cache.query_hits", tier="disk")
+                self._remember(key, stored)
+                return stored
+
+        vector = self.embeddings.embed_query(normalize_query(text))
+        with self._lock:
+            self.misses += 1
+        metric("embedding_cache.query_misses")
+        self._remember(key, vector)
+        if self.store is not None:
+            self.store.put_many(self.model, {key: vector})
+        return vector
+
+    def embed_queries(self, texts: List[str], max_workers: int = 4) -> List[List[float]]:
+        """embed_query for many questions; misses are embedded max_workers at a time.
+
+        Misses still go through the wrapped embed_query, not embed_documents,
+        since models such as Ollama's prefix queries and documents differently.
+        """
+        keys = [f"query:{text_hash(normalize_query(text))}" for text in texts]
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for key in keys:
+                if key in self._lru and key not in found:
+                    self._lru.move_to_end(key)
+                    found[key] = self._lru[key]
+
+        wanted = [key for key in dict.fromkeys(keys) if key not in found]
+        disk_hits = 0
+        if self.store is not None and wanted:
+            stored = self.store.get_many(self.model, wanted)
+            disk_hits = len(stored)
+            for key, vector in stored.items():
+                self._remember(key, vector)
+            found.update(stored)
+
+        # Embed each distinct missing question once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = normalize_query(text)
+        if missing:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(missing)))) as executor:
+                vectors = list(executor.map(propagate(self.embeddings.embed_query), missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            for key, vector in computed.items():
+                self._remember(key, vector)
+            if self.store is not None:
+                self.store.put_many(self.model, computed)
+            found.update(computed)
+
+        # Repeats of a question within the batch count as hits, as with sequential embed_query calls
+        memory_hits = len(texts) - disk_hits - len(missing)
+        with self._lock:
+            self.hits += memory_hits
+            self.disk_hits += disk_hits
+            self.misses += len(missing)
+        if memory_hits:
+            metric("embedding_cache.query_hits", memory_hits, tier="memory")
+        if disk_hits:
+            metric("embedding_cache.query_hits", disk_hits, tier="disk")
+        if missing:
+            metric("embedding_cache.query_misses", len(missing))
+        return [found[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.store is None:
+            return self.embeddings.embed_documents(texts)
+
+        keys = [f"doc:{text_hash(text)}" for text in texts]
+        found = self.store.get_many(self.model, list(dict.fromkeys(keys)))
+
+        # Embed each distinct missing text once, even if it repeats in the batch
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.store.put_many(self.model, computed)
+            found.update(computed)
+
+        with self._lock:
+            self.document_hits += len(texts) - len(missing)
+            self.document_misses += len(missing)
+        metric("embedding_cache.document_hits", len(texts) - len(missing))
+        metric("embedding_cache.document_misses", len(missing))
+        return [found[key] for key in keys]
+
+    def _remember(self, key: str, vector: List[float]):
+        with self._lock:
+            self._lru[key] = vector
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
@@ -0,0 +1,181 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.documents import Document
+from RAG.answer_cache import get_answer_cache
+from RAG.query_data import build_prompt, retrieve, retrieve_batch
+from RAG.resources import get_registry
+from RAG import telemetry
+from RAG.telemetry import percentiles
+
+EVAL_PROMPT = """
+Expected Response: {expected_response}
+Actual Response: {actual_response}
+---
+(Answer with 'true' or 'false') Does the actual response match the expected response?
+"""
+
+EVAL_QUESTIONS_PATH = "RAG/eval_questions.jsonl"
+
+# Spans reported per question, in pipeline order
+STAGES = ["rag.embed", "rag.search", "eval.retrieve", "rag.generate", "eval.judge", "eval.question"]
+
+
+@dataclass
+class EvalCase:
+    question: str
+    expected_response: str
+    # Chunk IDs, "source:page" prefixes or source paths any retrieved chunk may come from
+    expected_sources: List[str] = field(default_factory=list)
+
+
+@dataclass
+class CaseResult:
+    question: str
+    expected_response: str
+    answer: str = ""
+    retrieved_ids: List[str] = field(default_factory=list)
+    # 1-based rank of the first retrieved chunk from an expected source
+    hit_rank: Optional[int] = None
+    # None when the judge said neither 'true' nor 'false', or the question failed
+    passed: Optional[bool] = None
+    stage_ms: Dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+def load_questions(path: str = EVAL_QUESTIONS_PATH) -> List[EvalCase]:
+    """Cases from a JSON Lines file, or a JSON list, of {question, expected_response, expected_sources}"""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        records = json.loads(text)
+    else:
+        records = [json.loads(line) for line in text.splitlines() if line.strip()]
+    return [EvalCase(record["question"], record["expected_response"], list(record.get("expected_sources", [])))
+            for record in records]
+
+
+def hit_rank(retrieved_ids: List[str], expected_sources: List[str]) -> Optional[int]:
+    for rank, doc_id in enumerate(retrieved_ids, start=1):
+        if any(doc_id == expected or doc_id.startswith(expected + ":") for expected in expected_sources):
+            return rank
+    return None
+
+
+def judge(expected_response: str, actual_response: str, model_name: str = "llama3.1") -> Optional[bool]:
+    """Ask the model whether an answer matches the expected one"""
+    prompt = EVAL_PROMPT.format(expected_response=expected_response, actual_response=actual_response)
+    verdict = get_registry().llm(model_name).invoke(prompt).strip().lower()
+    if "true" in verdict:
+        return True
+    if "false" in verdict:
+        return False
+    return None
+
+
+class Evaluator:
+    """Answers and judges evaluation questions, max_workers questions at a time.
+
+    Each question is retrieved with query_data.retrieve, answered by
+    llm_model from build_prompt and judged by judge_model with EVAL_PROMPT.
+    The answer cache is skipped unless use_answer_cache, so every run times
+    real generations. With batch_retrieval all questions are retrieved up
+    front by one retrieve_batch call and only generation and judging run
+    per question.
+    """
+
+    def __init__(self, max_workers: int = 4, llm_model: str = "llama3.1", judge_model: str = "llama3.1",
+                 batch_retrieval: bool = False, use_answer_cache: bool = False):
+        self.max_workers = max_workers
+        self.llm_model = llm_model
+        self.judge_model = judge_model
+        self.batch_retrieval = batch_retrieval
+        self.use_answer_cache = use_answer_cache
+
+    def run(self, cases: List[EvalCase]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        retrieved: List[Optional[Tuple[List[float], List[Tuple[Document, float]]]]] = [None] * len(cases)
+        batch: Dict[str, Any] = {}
+        if self.batch_retrieval and cases:
+            with telemetry.trace() as batch_trace:
+                embeddings, results = retrieve_batch([case.question for case in cases])
+            retrieved = list(zip(embeddings, results))
+            batch = {"stages_ms": dict(batch_trace.breakdown()), "metrics": dict(batch_trace.metrics)}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            outcomes = list(executor.map(self._evaluate, cases, retrieved))
+        wall_seconds = time.perf_counter() - started
+
+        results = [result for result, _ in outcomes]
+        traces = [trace for _, trace in outcomes]
+        return self.report(cases, results, traces, wall_seconds, batch)
+
+    def _evaluate(self, case: EvalCase, retrieved) -> Tuple[CaseResult, telemetry.Trace]:
+        result = CaseResult(case.question, case.expected_response)
+        with telemetry.trace() as current:
+            with telemetry.span("eval.question"):
+                try:
+                    if retrieved is None:
+                        with telemetry.span("eval.retrieve"):
+                            retrieved = retrieve(case.question)
+                    query_embedding, results = retrieved
+                    result.retrieved_ids = [str(doc.metadata.get("id")) for doc, _score in results]
+                    result.hit_rank = hit_rank(result.retrieved_ids, case.expected_sources)
+
+                    answer = get_answer_cache().get(query_embedding, results) if self.use_answer_cache else None
+                    if answer is None:
+                        prompt = build_prompt(case.question, results)
+                        with telemetry.span("rag.generate"):
+                            answer = get_registry().llm(self.llm_model).invoke(prompt)
+                        if self.use_answer_cache:
+                            get_answer_cache().put(case.question, query_embedding, results, answer)
+                    result.answer = answer
+
+                    with telemetry.span("eval.judge"):
+                        result.passed = judge(case.expected_response, answer, self.judge_model)
+                except Exception as e:
+                    result.error = f"{type(e).__name__}: {e}"
+        result.stage_ms = dict(current.breakdown())
+        return result, current
+
+    def report(self, cases: List[EvalCase], results: List[CaseResult], traces: List[telemetry.Trace],
+               wall_seconds: float, batch: Dict[str, Any]) -> Dict[str, Any]:
+        judged = [result for result in results if result.passed is not None]
+        with_sources = [result for case, result in zip(cases, results) if case.expected_sources and result.error is None]
+        metrics: Dict[str, float] = dict(batch.get("metrics", {}))
+        for trace in traces:
+            for name, value in trace.metrics.items():
+                metrics[name] = metrics.get(name, 0.0) + value
+
+        return {
+            "config": {
+                "workers": self.max_workers,
+                "llm_model": self.llm_model,
+                "judge_model": self.judge_model,
+                "batch_retrieval": self.batch_retrieval,
+                "use_answer_cache": self.use_answer_cache,
+            },
+            "questions": len(results),
+            "errors": sum(result.error is not None for result in results),
+            "wall_seconds": wall_seconds,
+            "questions_per_second": len(results) / wall_seconds if wall_seconds else 0.0,
+            "accuracy": {
+                "judged": len(judged),
+                "passed": sum(bool(result.passed) for result in judged),
+                "pass_rate": sum(bool(result.passed) for result in judged) / len(judged) if judged else 0.0,
+                "unclear_verdicts": sum(result.passed is None and result.error is None for result in results),
+            },
+            "retrieval": {
+                "questions_with_sources": len(with_sources),
+                # Share of questions with at least one chunk from an expected source in the prompt
+                "hit_rate": sum(result.hit_rank is not None for result in with_sources) / len(with_sources) if with_sources else 0.0,
+                "mrr": sum(1.0 / result.hit_rank for result in with_sources if result.hit_rank) / len(with_sources) if with_sources else 0.0,
+            },
+            "stages": {stage: percentiles([result.stage_ms[stage] / 1000 for result in results if stage in result.stage_ms])
+                       for stage in STAGES if any(stage in result.stage_ms for result in results)},
+            "batch_retrieval": batch.get("stages_ms", {}),
+            "metrics": metrics,
+            "cases": [asdict(result) for result in results],
+        }
@@ -1,5 +1,22 @@
-from langchain_community.embeddings.ollama import OllamaEmbeddings
+import threading
+from typing import Dict, Optional
+from RAG.embedding_cache import CachedEmbeddings, EmbeddingStore
+from RAG.resources import get_registry
 
-def get_embedding_function():
-    embeddings = OllamaEmbeddings(model="mxbai-embed-large")
-    return embeddings
+EMBEDDING_MODEL = "mxbai-embed-large"
+
+# One cached embedding function per disk cache path, shared by every caller in
+# the process so repeated questions skip the Ollama round trip
+_cached_functions: Dict[Optional[str], CachedEmbeddings] = {}
+_lock = threading.Lock()
+
+def get_embedding_function(cache_path: Optional[str] = None, max_entries: int = 1024):
+    with _lock:
+        if cache_path not in _cached_functions:
+            registry = get_registry()
+            embeddings = registry.embeddings(EMBEDDING_MODEL)
+            store = EmbeddingStore(cache_path) if cache_path else None
+            # Vectors from another Ollama server (e.g. the stub) are cached apart from the real model's
+            model = f"{EMBEDDING_MODEL}@{registry.ollama_base_url}" if registry.ollama_base_url else EMBEDDING_MODEL
+            _cached_functions[cache_path] = CachedEmbeddings(embeddings, model, max_entries, store)
+        return _cached_functions[cache_path]
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List
+
+# Same pattern PyPDFDirectoryLoader uses, so sources match what it would produce
+PDF_GLOB = "**/[!.]*.pdf"
+
+
+@dataclass
+class ManifestDiff:
+    """Files in the data directory grouped by what ingestion has to do with them"""
+    new: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    # Unchanged files whose new mtime diff() wrote into the manifest; save it to keep them
+    touched: List[str] = field(default_factory=list)
+
+    @property
+    def to_load(self) -> List[str]:
+        return self.new + self.changed
+
+    @property
+    def to_remove(self) -> List[str]:
+        return self.changed + self.deleted
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FileManifest:
+    """JSON record of the path, size, mtime and SHA-256 of every ingested file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def diff(self, directory: str) -> ManifestDiff:
+        """Compare the directory with the manifest; files are only hashed if size or mtime moved"""
+        result = ManifestDiff()
+        current = sorted(str(p) for p in Path(directory).glob(PDF_GLOB) if p.is_file())
+
+        for path in current:
+            entry = self.entries.get(path)
+            if entry is None:
+                result.new.append(path)
+                continue
+
+            stat = os.stat(path)
+            if stat.st_size == entry["size"] and stat.st_mtime == entry["mtime"]:
+                result.unchanged.append(path)
+            elif file_sha256(path) == entry["sha256"]:
+                # Touched but identical: remember the new mtime to skip hashing next time
+                entry["mtime"] = stat.st_mtime
+                result.unchanged.append(path)
+                result.touched.append(path)
+            else:
+                result.changed.append(path)
+
+        present = set(current)
+        result.deleted = sorted(path for path in self.entries if path not in present)
+        return result
+
+    def record(self, path: str):
+        """Mark a file as ingested in its current state"""
+        stat = os.stat(path)
+        self.entries[path] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": file_sha256(path),
+        }
+
+    def forget(self, path: str):
+        self.entries.pop(path, None)
+
+    def reset(self):
+        self.entries = {}
+        self.save()
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp_path, self.path)
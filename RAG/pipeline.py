@@ -0,0 +1,205 @@
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from RAG.dynamodb_vector_store import BulkWriteReport, DynamoDBVectorStore
+from RAG.telemetry import metric, propagate, span
+
+# Passed down a queue once per consumer when its producer is finished
+_END = object()
+
+
+@dataclass
+class StageStats:
+    """Work done by one pipeline stage"""
+    name: str
+    items: int = 0
+    busy_seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Items per second of time the stage spent working (not waiting on queues)"""
+        return self.items / self.busy_seconds if self.busy_seconds else 0.0
+
+
+@dataclass
+class PipelineReport:
+    stages: Dict[str, StageStats] = field(default_factory=dict)
+    writes: BulkWriteReport = field(default_factory=BulkWriteReport)
+    wall_seconds: float = 0.0
+
+    def summary(self) -> str:
+        lines = [f"⏱️ Ingestion took {self.wall_seconds:.2f}s"]
+        for stats in self.stages.values():
+            lines.append(f"  {stats.name:<6} {stats.items:>7} items  {stats.busy_seconds:>7.2f}s busy  "
+                         f"{stats.throughput:>9.1f} items/s")
+        return "\n".join(lines)
+
+
+class IngestionPipeline:
+    """Load → split → embed → write, each stage on its own thread(s) joined by bounded queues.
+
+    Only a few batches are in flight between stages at any time, so memory
+    stays flat as the corpus grows and the total time approaches that of the
+    slowest stage. Several embedding batches are sent to the embedding server
+    at once.
+    """
+
+    def __init__(self, db: DynamoDBVectorStore, embedding_function: Embeddings,
+                 embed_batch_size: int = 32, embed_concurrency: int = 4,
+                 write_batch_size: int = 200, queue_size: int = 8):
+        self.db = db
+        self.embedding_function = embedding_function
+        self.embed_batch_size = embed_batch_size
+        self.embed_concurrency = embed_concurrency
+        self.write_batch_size = write_batch_size
+        self.queue_size = queue_size
+
+    def run(self, units: Iterable[List[Document]],
+            split: Optional[Callable[[List[Document]], List[Document]]] = None,
+            keep: Optional[Callable[[Document], bool]] = None) -> PipelineReport:
+        """Ingest an iterable of document groups (e.g. one per file).
+
+        `units` is consumed lazily on the load thread, so a generator that reads
+        files does its I/O there. `split` turns a group into chunks that already
+        carry metadata["id"]; `keep` can drop chunks before they are embedded.
+        """
+        report = PipelineReport(stages={name: StageStats(name) for name in ("load", "split", "embed", "write")})
+        loaded: queue.Queue = queue.Queue(self.queue_size)
+        batches: queue.Queue = queue.Queue(self.queue_size)
+        embedded: queue.Queue = queue.Queue(self.queue_size)
+        errors: List[BaseException] = []
+        stats_lock = threading.Lock()
+
+        def record(stage: str, items: int, started: float):
+            with stats_lock:
+                report.stages[stage].items += items
+                report.stages[stage].busy_seconds += time.perf_counter() - started
+
+        def fail(e: BaseException):
+            # Consumers keep draining after a failure so no producer blocks on a full queue
+            with stats_lock:
+                errors.append(e)
+
+        def load_stage():
+            iterator = None
+            try:
+                iterator = iter(units)
+                while not errors:
+                    started = time.perf_counter()
+                    try:
+                        documents = next(iterator)
+                    except StopIteration:
+                        return
+                    record("load", len(documents), started)
+                    loaded.put(documents)
+            except BaseException as e:
+                fail(e)
+            finally:
+                # Let generators release what they hold (files, worker pools) if stopped early
+                if hasattr(iterator, "close"):
+                    iterator.close()
+                loaded.put(_END)
+
+        def split_stage():
+            pending: List[Document] = []
+            while True:
+                documents = loaded.get()
+                if documents is _END:
+                    break
+                if errors:
+                    continue
+                try:
+                    started = time.perf_counter()
+                    chunks = split(documents) if split else documents
+                    if keep:
+                        chunks = [chunk for chunk in chunks if keep(chunk)]
+                    record("split", len(chunks), started)
+                except BaseException as e:
+                    fail(e)
+                    continue
+                pending.extend(chunks)
+                while len(pending) >= self.embed_batch_size:
+                    batches.put(pending[:self.embed_batch_size])
+                    pending = pending[self.embed_batch_size:]
+            if pending and not errors:
+                batches.put(pending)
+            for _ in range(self.embed_concurrency):
+                batches.put(_END)
+
+        def embed_stage():
+            while True:
+                chunks = batches.get()
+                if chunks is _END:
+                    embedded.put(_END)
+                    return
+                if errors:
+                    continue
+                try:
+                    started = time.perf_counter()
+                    vectors = self.embedding_function.embed_documents([chunk.page_content for chunk in chunks])
+                    record("embed", len(chunks), started)
+                except BaseException as e:
+                    fail(e)
+                    continue
+                embedded.put((chunks, vectors))
+
+        def write_stage():
+            chunks: List[Document] = []
+            vectors: List[List[float]] = []
+            finished = 0
+
+            def flush():
+                try:
+                    started = time.perf_counter()
+                    written = self.db.bulk_add_documents(chunks, vectors, [chunk.metadata["id"] for chunk in chunks])
+                    record("write", len(chunks), started)
+                    report.writes.succeeded.extend(written.succeeded)
+                    report.writes.failed.update(written.failed)
+                except BaseException as e:
+                    fail(e)
+                chunks.clear()
+                vectors.clear()
+
+            while finished < self.embed_concurrency:
+                entry = embedded.get()
+                if entry is _END:
+                    finished += 1
+                    continue
+                if errors:
+                    continue
+                chunks.extend(entry[0])
+                vectors.extend(entry[1])
+                if len(chunks) >= self.write_batch_size:
+                    flush()
+            if chunks and not errors:
+                flush()
+
+        # Stage threads report to the caller's telemetry trace
+        threads = [
+            threading.Thread(target=propagate(load_stage), name="ingest-load"),
+            threading.Thread(target=propagate(split_stage), name="ingest-split"),
+            threading.Thread(target=propagate(write_stage), name="ingest-write"),
+        ]
+        threads += [
+            threading.Thread(target=propagate(embed_stage), name=f"ingest-embed-{i}")
+            for i in range(self.embed_concurrency)
+        ]
+
+        with span("ingest.pipeline"):
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            report.wall_seconds = time.perf_counter() - started
+        for stats in report.stages.values():
+            metric(f"ingest.{stats.name}.items", stats.items)
+            metric(f"ingest.{stats.name}.busy_seconds", stats.busy_seconds)
+
+        if errors:
+            raise errors[0]
+        return report
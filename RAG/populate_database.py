@@ -1,37 +1,130 @@
 import argparse
 import os
 import shutil
-from langchain_community.document_loaders import PyPDFDirectoryLoader
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 from RAG.get_embedding_function import get_embedding_function
-from RAG.dynamodb_vector_store import DynamoDBVectorStore
+from RAG.dynamodb_vector_store import BulkWriteReport, DynamoDBVectorStore
+from RAG.manifest import FileManifest
+from RAG.answer_cache import get_answer_cache
+from RAG.bm25_index import LEXICAL_INDEX_PATH
+from RAG.ann_index import ANN_INDEX_PATH
+from RAG import telemetry
+from RAG.pipeline import IngestionPipeline
+from RAG.resources import configure_resources
 import time
 
 DATA_PATH = "data"
+# Embeddings keyed by chunk text hash; kept across --reset so unchanged chunks are not re-embedded
+EMBEDDING_CACHE_PATH = "embedding_cache.sqlite3"
+# Path, size, mtime and hash of every ingested file (hidden, so the PDF glob skips it)
+MANIFEST_PATH = os.path.join(DATA_PATH, ".manifest.json")
+# Chunks per embedding request, and how many requests are in flight at once
+EMBED_BATCH_SIZE = 32
+EMBED_CONCURRENCY = 4
 
 def main():
     # Check if the database should be cleared (using the --clear flag).
     parser = argparse.ArgumentParser()
     parser.add_argument("--reset", action="store_true", help="Reset the database.")
+    parser.add_argument("--truncate", action="store_true", help="With --reset, drop and recreate the table instead of deleting items.")
+    parser.add_argument("--workers", type=int, default=1, help="Processes used to parse and split PDFs.")
+    parser.add_argument("--ollama-url", help="Embed with this Ollama server, e.g. `python -m RAG.stubs` for offline runs.")
     args = parser.parse_args()
+    if args.ollama_url:
+        configure_resources(ollama_base_url=args.ollama_url)
     if args.reset:
         print("✨ Clearing Database")
-        clear_database()
+        clear_database(truncate=args.truncate)
 
     # Create (or update) the data store.
-    documents = load_documents()
-    chunks = split_documents(documents)
-    add_to_dynamodb(chunks)
+    load(workers=args.workers)
+
+def load(workers: int = 1):
+    # Only new or changed files are loaded, split and embedded
+    manifest = FileManifest(MANIFEST_PATH)
+    changes = manifest.diff(DATA_PATH)
+    print(f"📂 {len(changes.new)} new, {len(changes.changed)} changed, "
+          f"{len(changes.deleted)} deleted, {len(changes.unchanged)} unchanged files")
+
+    # Drop the chunks of changed and deleted files so stale ones don't pile up.
+    # New files are included: a clear that failed partway leaves chunks of files
+    # the manifest has forgotten, and checking costs one GSI query per file
+    stale = changes.to_remove + changes.new
+    if stale:
+        db = make_store()
+        for path in stale:
+            db.delete_by_source(path)
+            manifest.forget(path)
+        manifest.save()
+        # Answers generated from those files may no longer be true
+        get_answer_cache().invalidate_sources(stale)
+
+    if not changes.to_load:
+        if changes.touched and not changes.to_remove:
+            # Otherwise touched files would be hashed again on every run
+            manifest.save()
+        print("✅ No new documents to add")
+        return
+
+    # Sources being loaded have no chunks left in the table, so skip the ID lookup
+    report = ingest_files(changes.to_load, workers)
 
-def load():
-    documents = load_documents()
-    chunks = split_documents(documents)
-    add_to_dynamodb(chunks)
+    failed_sources = {doc_id.rsplit(":", 2)[0] for doc_id in report.failed}
+    for path in changes.to_load:
+        if path not in failed_sources:
+            manifest.record(path)
+    manifest.save()
 
-def load_documents():
-    document_loader = PyPDFDirectoryLoader(DATA_PATH)
-    return document_loader.load()
+def ingest_files(paths: list[str], workers: int = 1):
+    # Stream files through load → split → embed → write instead of holding them all in memory
+    if workers > 1 and len(paths) > 1:
+        report = make_pipeline().run(iter_split_files(paths, workers))
+    else:
+        report = make_pipeline().run(
+            (PyPDFLoader(path).load() for path in paths),
+            split=lambda documents: calculate_chunk_ids(split_documents(documents)),
+        )
+    print(report.summary())
+    print_write_report(report.writes)
+    return report.writes
+
+def split_file(path: str):
+    # Runs in a worker process: return plain (content, metadata) records rather
+    # than Document objects so little has to be pickled back to the parent
+    chunks = calculate_chunk_ids(split_documents(PyPDFLoader(path).load()))
+    return [(chunk.page_content, chunk.metadata) for chunk in chunks]
+
+def iter_split_files(paths: list[str], workers: int):
+    # PDF parsing is CPU-bound, so spread files over processes; results are
+    # yielded in input order and at most 2 * workers files are in flight
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for path in paths:
+            pending.append(executor.submit(split_file, path))
+            if len(pending) >= 2 * workers:
+                yield to_documents(pending.popleft().result())
+        while pending:
+            yield to_documents(pending.popleft().result())
+
+def to_documents(records):
+    return [Document(page_content=content, metadata=metadata) for content, metadata in records]
+
+def make_store():
+    # Every writer keeps the BM25 index next to the table in step, and the IVF
+    # index too once scripts/ann_report.py has built one
+    return DynamoDBVectorStore(lexical_index_path=LEXICAL_INDEX_PATH, ann_index_path=ANN_INDEX_PATH)
+
+def make_pipeline():
+    return IngestionPipeline(
+        make_store(),
+        get_embedding_function(cache_path=EMBEDDING_CACHE_PATH),
+        embed_batch_size=EMBED_BATCH_SIZE,
+        embed_concurrency=EMBED_CONCURRENCY,
+    )
 
 def split_documents(documents: list[Document]):
     text_splitter = RecursiveCharacterTextSplitter(
@@ -42,17 +135,19 @@ def split_documents(documents: list[Document]):
     )
     return text_splitter.split_documents(documents)
 
-def add_to_dynamodb(chunks: list[Document]):
+def add_to_dynamodb(chunks: list[Document], check_existing: bool = True):
     # Initialize DynamoDB vector store
-    db = DynamoDBVectorStore()
-    embedding_function = get_embedding_function()
+    db = make_store()
 
     # Calculate Page IDs
     chunks_with_ids = calculate_chunk_ids(chunks)
 
-    # Get existing IDs
-    existing_ids = set(db.get_existing_ids())
-    print(f"Number of existing documents in DB: {len(existing_ids)}")
+    # Look up only the candidate IDs instead of scanning the whole table
+    existing_ids = set()
+    if check_existing:
+        with telemetry.span("ingest.find_existing", items=len(chunks_with_ids)):
+            existing_ids = set(db.find_existing_ids([chunk.metadata["id"] for chunk in chunks_with_ids]))
+        print(f"Number of these documents already in DB: {len(existing_ids)}")
 
     # Only add documents that don't exist in the DB
     new_chunks = []
@@ -63,18 +158,22 @@ def add_to_dynamodb(chunks: list[Document]):
     if len(new_chunks):
         print(f"👉 Adding new documents: {len(new_chunks)}")
         
-        # Generate embeddings for new chunks
-        texts = [chunk.page_content for chunk in new_chunks]
-        embeddings = embedding_function.embed_documents(texts)
-        
-        # Get IDs for new chunks
-        new_chunk_ids = [chunk.metadata["id"] for chunk in new_chunks]
-        
-        # Add to DynamoDB
-        db.add_documents(new_chunks, embeddings, new_chunk_ids)
-        print("✅ Documents added to DynamoDB")
+        # Embed in concurrent batches and write as each batch is ready
+        report = make_pipeline().run([new_chunks])
+        print(report.summary())
+        print_write_report(report.writes)
+        return report.writes
     else:
         print("✅ No new documents to add")
+        return BulkWriteReport()
+
+def print_write_report(report: BulkWriteReport):
+    if report.ok:
+        print(f"✅ Documents added to DynamoDB: {len(report.succeeded)}")
+    else:
+        print(f"⚠️ Added {len(report.succeeded)} documents, {len(report.failed)} failed:")
+        for doc_id, error in report.failed.items():
+            print(f"  {doc_id}: {error}")
 
 def calculate_chunk_ids(chunks):
 
@@ -104,16 +203,20 @@ def calculate_chunk_ids(chunks):
 
     return chunks
 
-def clear_database():
-    db = DynamoDBVectorStore()
-    db.clear_all()
-    print("✅ DynamoDB cleared")
+def clear_database(truncate: bool = False):
+    db = make_store()
+    deleted = db.clear_all(truncate=truncate)
+    FileManifest(MANIFEST_PATH).reset()
+    get_answer_cache().clear()
+    print(f"✅ DynamoDB cleared ({deleted} items deleted)")
 
 # Never Called this function because above is safe enough
-def clear_database_new():
-    db = DynamoDBVectorStore()
-    db.clear_all()
-    print("✅ DynamoDB cleared")
+def clear_database_new(truncate: bool = False):
+    db = make_store()
+    deleted = db.clear_all(truncate=truncate)
+    FileManifest(MANIFEST_PATH).reset()
+    get_answer_cache().clear()
+    print(f"✅ DynamoDB cleared ({deleted} items deleted)")
 
 if __name__ == "__main__":
     main()
@@ -1,8 +1,17 @@
 import argparse
+import asyncio
+import threading
+from typing import Iterator, List, Optional, Tuple
+from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_community.llms.ollama import Ollama
 from RAG.get_embedding_function import get_embedding_function
 from RAG.dynamodb_vector_store import DynamoDBVectorStore
+from RAG.async_vector_store import AsyncDynamoDBVectorStore, PerLoopSemaphore
+from RAG.search_filter import SearchFilter
+from RAG.answer_cache import get_answer_cache
+from RAG.bm25_index import LEXICAL_INDEX_PATH
+from RAG.resources import get_registry
+from RAG import telemetry
 
 PROMPT_TEMPLATE = """
 Answer the question based only on the following context:
@@ -14,37 +23,216 @@ Answer the question based only on the following context:
 Answer the question based on the above context: {question}
 """
 
+# Chunks put in the prompt
+RETRIEVAL_K = 5
+# Fuse BM25 and vector rankings so exact terms (clause numbers, parties, amounts) are found at k=5
+HYBRID_SEARCH = True
+# Pick the RETRIEVAL_K chunks out of MMR_FETCH_K by maximal marginal relevance so
+# overlapping neighbours of one page don't crowd out other passages
+MMR_SEARCH = True
+MMR_FETCH_K = 20
+MMR_LAMBDA = 0.5
+# Join chunks that follow each other on the same page into one context block
+MERGE_ADJACENT_CHUNKS = True
+# Longest overlap between neighbouring chunks to look for (split_documents uses 80)
+MAX_CHUNK_OVERLAP = 200
+
+# Reload the in-memory index this often to pick up chunks written by other processes
+INDEX_TTL_SECONDS = 300
+
+# Limits for aquery_rag: concurrent DynamoDB calls and concurrent generations
+DB_CONCURRENCY = 16
+LLM_CONCURRENCY = 4
+
+_async_db: Optional[AsyncDynamoDBVectorStore] = None
+_async_db_lock = threading.Lock()
+# Bounds concurrent generations across every aquery_rag call in the process
+llm_semaphore = PerLoopSemaphore(LLM_CONCURRENCY)
+
 def main():
     # Create CLI.
     parser = argparse.ArgumentParser()
     parser.add_argument("query_text", type=str, help="The query text.")
+    parser.add_argument("--source", action="append", help="Only answer from this source file (repeatable).")
     args = parser.parse_args()
     query_text = args.query_text
-    query_rag(query_text)
+    search_filter = SearchFilter(sources=args.source) if args.source else None
+    query_rag(query_text, search_filter)
 
-def query_rag(query_text: str):
+def query_rag(query_text: str, search_filter: Optional[SearchFilter] = None):
+    with telemetry.span("rag.query"):
+        query_embedding, results = retrieve(query_text, search_filter)
+
+        # Near-duplicate questions answered from the same chunks reuse the earlier answer
+        answer_cache = get_answer_cache()
+        response_text = answer_cache.get(query_embedding, results)
+        if response_text is None:
+            with telemetry.span("rag.prompt"):
+                prompt = build_prompt(query_text, results)
+            # print(prompt)
+
+            with telemetry.span("rag.generate"):
+                model = get_registry().llm("llama3.1")
+                response_text = model.invoke(prompt)
+            answer_cache.put(query_text, query_embedding, results, response_text)
+
+    print_response(response_text, results)
+    return response_text
+
+def stream_rag(query_text: str, search_filter: Optional[SearchFilter] = None) -> Tuple[List[Optional[str]], Iterator[str]]:
+    # Returns the source IDs right away and an iterator of answer tokens as llama3.1 generates them
+    query_embedding, results = retrieve(query_text, search_filter)
+    sources = [doc.metadata.get("id", None) for doc, _score in results]
+
+    answer_cache = get_answer_cache()
+    cached = answer_cache.get(query_embedding, results)
+    if cached is not None:
+        return sources, iter([cached])
+
+    def tokens():
+        model = get_registry().llm("llama3.1")
+        parts = []
+        with telemetry.span("rag.prompt"):
+            prompt = build_prompt(query_text, results)
+        with telemetry.span("rag.generate") as generate_span:
+            for token in model.stream(prompt):
+                parts.append(token)
+                yield token
+            generate_span.attributes["tokens"] = len(parts)
+        # Only complete answers are cached, not ones cut short by the reader
+        answer_cache.put(query_text, query_embedding, results, "".join(parts))
+
+    return sources, tokens()
+
+def retrieve(query_text: str, search_filter: Optional[SearchFilter] = None) -> Tuple[List[float], List[Tuple[Document, float]]]:
     # Prepare the DB.
     embedding_function = get_embedding_function()
-    db = DynamoDBVectorStore()
+    db = DynamoDBVectorStore(in_memory_index=True, index_ttl=INDEX_TTL_SECONDS, lexical_index_path=LEXICAL_INDEX_PATH)
 
     # Generate query embedding
-    query_embedding = embedding_function.embed_query(query_text)
+    with telemetry.span("rag.embed"):
+        query_embedding = embedding_function.embed_query(query_text)
     
     # Search the DB.
-    results = db.similarity_search_with_score(query_embedding, k=5)
+    with telemetry.span("rag.search"):
+        fetch_k = MMR_FETCH_K if MMR_SEARCH else RETRIEVAL_K
+        if HYBRID_SEARCH:
+            results = db.hybrid_search_with_score(query_text, query_embedding, k=fetch_k, search_filter=search_filter)
+        else:
+            results = db.similarity_search_with_score(query_embedding, k=fetch_k, search_filter=search_filter)
+        if MMR_SEARCH:
+            results = db.diversify(query_embedding, results, RETRIEVAL_K, MMR_LAMBDA, use_scores=HYBRID_SEARCH)
+        return query_embedding, results
+
+def retrieve_batch(query_texts: List[str], search_filter: Optional[SearchFilter] = None) -> Tuple[List[List[float]], List[List[Tuple[Document, float]]]]:
+    # retrieve() for many questions with one batched embedding call and one pass over the vectors
+    embedding_function = get_embedding_function()
+    db = DynamoDBVectorStore(in_memory_index=True, index_ttl=INDEX_TTL_SECONDS, lexical_index_path=LEXICAL_INDEX_PATH)
+
+    with telemetry.span("rag.embed", queries=len(query_texts)):
+        query_embeddings = embedding_function.embed_queries(query_texts)
+
+    with telemetry.span("rag.search", queries=len(query_texts)):
+        fetch_k = MMR_FETCH_K if MMR_SEARCH else RETRIEVAL_K
+        if HYBRID_SEARCH:
+            batches = db.hybrid_search_batch(query_texts, query_embeddings, k=fetch_k, search_filter=search_filter)
+        else:
+            batches = db.similarity_search_batch(query_embeddings, k=fetch_k, search_filter=search_filter)
+        if MMR_SEARCH:
+            batches = [db.diversify(query_embedding, results, RETRIEVAL_K, MMR_LAMBDA, use_scores=HYBRID_SEARCH)
+                       for query_embedding, results in zip(query_embeddings, batches)]
+        return query_embeddings, batches
+
+async def aquery_rag(query_text: str, search_filter: Optional[SearchFilter] = None):
+    # Same as query_rag, but awaits each network call so one process can answer many questions
+    embedding_function = get_embedding_function()
+    db = get_async_vector_store()
+
+    # Embed the question while the in-memory index warms up
+    with telemetry.span("rag.embed"):
+        query_embedding, _ = await asyncio.gather(
+            embedding_function.aembed_query(query_text),
+            db.awarm_index(),
+        )
+
+    with telemetry.span("rag.search"):
+        fetch_k = MMR_FETCH_K if MMR_SEARCH else RETRIEVAL_K
+        if HYBRID_SEARCH:
+            results = await db.ahybrid_search_with_score(query_text, query_embedding, k=fetch_k, search_filter=search_filter)
+        else:
+            results = await db.asimilarity_search_with_score(query_embedding, k=fetch_k, search_filter=search_filter)
+        if MMR_SEARCH:
+            results = await db.adiversify(query_embedding, results, RETRIEVAL_K, MMR_LAMBDA, use_scores=HYBRID_SEARCH)
+
+    answer_cache = get_answer_cache()
+    response_text = answer_cache.get(query_embedding, results)
+    if response_text is None:
+        with telemetry.span("rag.prompt"):
+            prompt = build_prompt(query_text, results)
 
-    context_text = "\n\n---\n\n".join([doc.page_content for doc, _score in results])
+        model = get_registry().llm("llama3.1")
+        async with llm_semaphore():
+            with telemetry.span("rag.generate"):
+                response_text = await model.ainvoke(prompt)
+        answer_cache.put(query_text, query_embedding, results, response_text)
+
+    print_response(response_text, results)
+    return response_text
+
+def build_prompt(query_text: str, results: List[Tuple[Document, float]]) -> str:
+    if MERGE_ADJACENT_CHUNKS:
+        context_text = "\n\n---\n\n".join(merge_adjacent_chunks(results))
+    else:
+        context_text = "\n\n---\n\n".join([doc.page_content for doc, _score in results])
     prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
-    prompt = prompt_template.format(context=context_text, question=query_text)
-    # print(prompt)
+    return prompt_template.format(context=context_text, question=query_text)
+
+def merge_adjacent_chunks(results: List[Tuple[Document, float]]) -> List[str]:
+    # Chunks with consecutive IDs on one page ("data/x.pdf:6:2", "data/x.pdf:6:3")
+    # become one block with the splitter's overlap removed; blocks keep the
+    # rank of their best chunk
+    pages = {}
+    for doc, _score in results:
+        doc_id = doc.metadata.get("id") or ""
+        page_id, _, index = doc_id.rpartition(":")
+        if not page_id or not index.isdigit():
+            pages[id(doc)] = [(0, doc.page_content)]
+            continue
+        pages.setdefault(page_id, []).append((int(index), doc.page_content))
 
-    model = Ollama(model="llama3.1")
-    response_text = model.invoke(prompt)
+    blocks = []
+    for chunks in pages.values():
+        chunks.sort()
+        text, last_index = chunks[0][1], chunks[0][0]
+        for index, content in chunks[1:]:
+            if index == last_index + 1:
+                text = join_overlapping(text, content)
+            else:
+                blocks.append(text)
+                text = content
+            last_index = index
+        blocks.append(text)
+    return blocks
 
+def join_overlapping(first: str, second: str) -> str:
+    for size in range(min(len(first), len(second), MAX_CHUNK_OVERLAP), 9, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n" + second
+
+def print_response(response_text: str, results: List[Tuple[Document, float]]):
     sources = [doc.metadata.get("id", None) for doc, _score in results]
     formatted_response = f"Response: {response_text}\nSources: {sources}"
     print(formatted_response)
-    return response_text
+
+def get_async_vector_store() -> AsyncDynamoDBVectorStore:
+    # One store (and connection pool) shared by every aquery_rag call in the process
+    global _async_db
+    with _async_db_lock:
+        if _async_db is None:
+            _async_db = AsyncDynamoDBVectorStore(max_concurrency=DB_CONCURRENCY, in_memory_index=True,
+                                                 index_ttl=INDEX_TTL_SECONDS, lexical_index_path=LEXICAL_INDEX_PATH)
+        return _async_db
 
 if __name__ == "__main__":
     main()
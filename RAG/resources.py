@@ -0,0 +1,130 @@
+import threading
+from typing import Any, Dict, Optional, Tuple
+import boto3
+from botocore.config import Config
+from langchain_community.embeddings.ollama import OllamaEmbeddings
+from langchain_community.llms.ollama import Ollama
+from RAG.telemetry import instrument_dynamodb
+
+AWS_REGION = "us-east-1"
+LOCAL_ENDPOINT = "http://localhost:8000"
+
+# Connections kept open per client, TCP keep-alive, and retries with client-side rate limiting
+MAX_POOL_CONNECTIONS = 64
+TCP_KEEPALIVE = True
+MAX_ATTEMPTS = 10
+RETRY_MODE = "adaptive"
+
+
+class ResourceRegistry:
+    """Process-wide boto3 sessions, clients and resources plus Ollama clients.
+
+    Everything is created on first use and then reused, so repeated calls
+    (one per question in the UI, one per tool call in the MCP server) share
+    warm connection pools instead of paying for new TCP/TLS handshakes.
+    Clients are keyed by service, endpoint (DynamoDB Local or AWS) and pool
+    size; the pool can be enlarged for callers that run many requests at once.
+    DynamoDB clients report consumed capacity to RAG.telemetry. Ollama clients
+    talk to ollama_base_url when set (e.g. RAG.stubs.StubOllamaServer), else
+    to Ollama's default address.
+    """
+
+    def __init__(self, max_pool_connections: int = MAX_POOL_CONNECTIONS, tcp_keepalive: bool = TCP_KEEPALIVE,
+                 max_attempts: int = MAX_ATTEMPTS, retry_mode: str = RETRY_MODE, region_name: str = AWS_REGION,
+                 ollama_base_url: Optional[str] = None):
+        self.max_pool_connections = max_pool_connections
+        self.tcp_keepalive = tcp_keepalive
+        self.max_attempts = max_attempts
+        self.retry_mode = retry_mode
+        self.region_name = region_name
+        self.ollama_base_url = ollama_base_url
+        # Creating clients from one session is not thread-safe; using them is
+        self._lock = threading.RLock()
+        self._sessions: Dict[bool, boto3.session.Session] = {}
+        self._clients: Dict[Tuple[str, bool, int], Any] = {}
+        self._resources: Dict[Tuple[str, bool, int], Any] = {}
+        self._embeddings: Dict[str, OllamaEmbeddings] = {}
+        self._llms: Dict[str, Ollama] = {}
+
+    def config(self, max_pool_connections: Optional[int] = None) -> Config:
+        return Config(
+            region_name=self.region_name,
+            max_pool_connections=max_pool_connections or self.max_pool_connections,
+            tcp_keepalive=self.tcp_keepalive,
+            retries={"max_attempts": self.max_attempts, "mode": self.retry_mode},
+        )
+
+    def session(self, local: bool = False) -> boto3.session.Session:
+        """Session for DynamoDB Local (fake credentials) or for AWS (default credential chain)"""
+        with self._lock:
+            if local not in self._sessions:
+                if local:
+                    self._sessions[local] = boto3.session.Session(
+                        aws_access_key_id="fake",
+                        aws_secret_access_key="fake",
+                        region_name=self.region_name,
+                    )
+                else:
+                    self._sessions[local] = boto3.session.Session(region_name=self.region_name)
+            return self._sessions[local]
+
+    def client(self, service: str, local: bool = False, max_pool_connections: Optional[int] = None):
+        pool = max_pool_connections or self.max_pool_connections
+        key = (service, local, pool)
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = self.session(local).client(
+                    service, endpoint_url=LOCAL_ENDPOINT if local else None, config=self.config(pool))
+                if service == "dynamodb":
+                    instrument_dynamodb(self._clients[key])
+            return self._clients[key]
+
+    def resource(self, service: str, local: bool = False, max_pool_connections: Optional[int] = None):
+        pool = max_pool_connections or self.max_pool_connections
+        key = (service, local, pool)
+        with self._lock:
+            if key not in self._resources:
+                self._resources[key] = self.session(local).resource(
+                    service, endpoint_url=LOCAL_ENDPOINT if local else None, config=self.config(pool))
+                if service == "dynamodb":
+                    instrument_dynamodb(self._resources[key].meta.client)
+            return self._resources[key]
+
+    def embeddings(self, model: str) -> OllamaEmbeddings:
+        with self._lock:
+            if model not in self._embeddings:
+                self._embeddings[model] = OllamaEmbeddings(model=model, **self._ollama_settings())
+            return self._embeddings[model]
+
+    def llm(self, model: str = "llama3.1") -> Ollama:
+        with self._lock:
+            if model not in self._llms:
+                self._llms[model] = Ollama(model=model, **self._ollama_settings())
+            return self._llms[model]
+
+    def _ollama_settings(self) -> Dict[str, Any]:
+        return {"base_url": self.ollama_base_url} if self.ollama_base_url else {}
+
+
+_registry: Optional[ResourceRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ResourceRegistry:
+    """Return the process-wide registry, creating it with default settings if needed"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ResourceRegistry()
+        return _registry
+
+
+def configure_resources(**settings) -> ResourceRegistry:
+    """Replace the process-wide registry, e.g. to change pool size or retries at startup.
+
+    Clients already handed out keep working with their old settings.
+    """
+    global _registry
+    with _registry_lock:
+        _registry = ResourceRegistry(**settings)
+        return _registry
@@ -0,0 +1,102 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, Optional
+from RAG.telemetry import propagate
+
+# Marks the end of one segment on the shared page queue
+_SEGMENT_DONE = object()
+
+
+def scan_items(table, total_segments: int = 1, max_workers: Optional[int] = None, **scan_kwargs) -> Iterator[Dict[str, Any]]:
+    """Stream every item of a table, following LastEvaluatedKey to the end.
+
+    With total_segments > 1 the table is split into Segment/TotalSegments parts
+    that are scanned concurrently on a thread pool; items then arrive in no
+    particular order. Extra keyword arguments (ProjectionExpression,
+    FilterExpression, ...) are passed to every Scan call.
+    """
+    for response in _scan_responses(table, total_segments, max_workers, scan_kwargs):
+        yield from response.get('Items', [])
+
+
+def count_items(table, total_segments: int = 1, max_workers: Optional[int] = None, **scan_kwargs) -> int:
+    """Count a table's items with Select=COUNT scans, which transfer no attributes"""
+    return sum(response['Count'] for response in
+               _scan_responses(table, total_segments, max_workers, dict(scan_kwargs, Select='COUNT')))
+
+
+def _scan_responses(table, total_segments: int, max_workers: Optional[int],
+                    scan_kwargs: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Yield every Scan response, from one paginated scan or several concurrent segments"""
+    # The resource's client is thread-safe, the Table object is not
+    client = table.meta.client
+    scan_kwargs['TableName'] = table.name
+
+    if total_segments <= 1:
+        yield from _scan_pages(client, scan_kwargs)
+        return
+
+    pages: queue.Queue = queue.Queue(maxsize=2 * total_segments)
+    stop = threading.Event()
+
+    def put(entry) -> bool:
+        # Give up once the consumer has stopped reading so workers can exit
+        while not stop.is_set():
+            try:
+                pages.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def scan_segment(segment: int):
+        try:
+            segment_kwargs = dict(scan_kwargs, Segment=segment, TotalSegments=total_segments)
+            for page in _scan_pages(client, segment_kwargs):
+                if not put(page):
+                    return
+            put(_SEGMENT_DONE)
+        except Exception as e:
+            put(e)
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers or total_segments, total_segments))
+    try:
+        for segment in range(total_segments):
+            executor.submit(propagate(scan_segment), segment)
+
+        finished = 0
+        while finished < total_segments:
+            entry = pages.get()
+            if entry is _SEGMENT_DONE:
+                finished += 1
+            elif isinstance(entry, Exception):
+                raise entry
+            else:
+                yield entry
+    finally:
+        stop.set()
+        executor.shutdown(wait=False)
+
+
+def _scan_pages(client, scan_kwargs: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Yield each Scan response, following LastEvaluatedKey"""
+    kwargs = dict(scan_kwargs)
+    while True:
+        response = client.scan(**kwargs)
+        yield response
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def query_items(table, **query_kwargs) -> Iterator[Dict[str, Any]]:
+    """Stream every item matching a Query (table or GSI), following LastEvaluatedKey"""
+    query_kwargs['TableName'] = table.name
+    client = table.meta.client
+    while True:
+        response = client.query(**query_kwargs)
+        yield from response.get('Items', [])
+        if 'LastEvaluatedKey' not in response:
+            return
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
@@ -0,0 +1,42 @@
+from typing import Any, Dict
+
+EMBEDDINGS_TABLE = "EMBEDDINGS"
+SOURCE_INDEX = "Source-Index"
+
+
+def embeddings_table_definition(table_name: str = EMBEDDINGS_TABLE) -> Dict[str, Any]:
+    """CreateTable arguments for the EMBEDDINGS table and its Source-Index GSI"""
+    return {
+        'TableName': table_name,
+        'KeySchema': [
+            {
+                'AttributeName': 'id',
+                'KeyType': 'HASH'  # Partition key
+            }
+        ],
+        'AttributeDefinitions': [
+            {
+                'AttributeName': 'id',
+                'AttributeType': 'S'
+            },
+            {
+                'AttributeName': 'source',
+                'AttributeType': 'S'
+            }
+        ],
+        'GlobalSecondaryIndexes': [
+            {
+                'IndexName': SOURCE_INDEX,
+                'KeySchema': [
+                    {
+                        'AttributeName': 'source',
+                        'KeyType': 'HASH'
+                    }
+                ],
+                'Projection': {
+                    'ProjectionType': 'ALL'
+                }
+            }
+        ],
+        'BillingMode': 'PAY_PER_REQUEST'
+    }
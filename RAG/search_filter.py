@@ -0,0 +1,39 @@
+import json
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+@dataclass
+class SearchFilter:
+    """Restricts a similarity search to some sources, pages or metadata values.
+
+    sources: source file paths to search; uses the Source-Index GSI instead of a scan
+    pages: inclusive (first, last) page ranges
+    metadata: exact values metadata keys must have
+    predicates: callables taking the metadata dict and returning True to keep a chunk
+    """
+    sources: Optional[List[str]] = None
+    pages: Optional[List[Tuple[int, int]]] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    predicates: List[Callable[[Dict[str, Any]], bool]] = field(default_factory=list)
+
+    @property
+    def needs_metadata(self) -> bool:
+        """Whether matching has to decode the metadata JSON"""
+        return bool(self.metadata or self.predicates)
+
+    def matches(self, source: str, page: Any, metadata_json: Optional[str] = None) -> bool:
+        """Check one chunk, decoding its metadata only if a metadata test needs it"""
+        if self.sources is not None and source not in self.sources:
+            return False
+        if self.pages is not None:
+            page = int(page or 0)
+            if not any(first <= page <= last for first, last in self.pages):
+                return False
+        if not self.needs_metadata:
+            return True
+
+        metadata = json.loads(metadata_json or '{}')
+        if any(metadata.get(key) != value for key, value in self.metadata.items()):
+            return False
+        return all(predicate(metadata) for predicate in self.predicates)
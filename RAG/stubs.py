@@ -0,0 +1,156 @@
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from RAG.bm25_index import tokenize
+
+_WORD = re.compile(r"\w+")
+
+# Next to Ollama's 11434, so both can run; pass the URL as --ollama-url
+STUB_PORT = 11435
+
+
+@lru_cache(maxsize=65536)
+def _word_vector(word: str, dim: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(word.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic stand-in for OllamaEmbeddings, for benchmarks and tests.
+
+    Every word maps to a fixed pseudo-random vector derived from its hash and
+    a text embeds to the normalized sum of its words, so texts sharing words
+    score higher against each other and the same text always gives the same
+    vector, on any machine, without an embedding server.
+    """
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in _WORD.findall(text.lower()):
+            vector += _word_vector(word, self.dim)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+
+class StubOllamaServer:
+    """Local HTTP server speaking enough of the Ollama API for offline runs.
+
+    /api/embeddings and /api/embed answer with HashEmbeddings vectors.
+    /api/generate answers a RAG prompt with the context sentence sharing the
+    most terms with the question, and a judge prompt (one with "Expected
+    Response:") with "true" when every term of the expected response is in the
+    actual one. delay seconds are added to each generation to stand in for a
+    model. The answers are deterministic, so runs can be compared, but they
+    say nothing about the quality of a real model. Port 0 picks a free port.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, dim: int = 1024, delay: float = 0.0):
+        self.embeddings = HashEmbeddings(dim)
+        self.delay = delay
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubOllamaServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def generate(self, prompt: str) -> str:
+        if self.delay:
+            time.sleep(self.delay)
+        judged = re.search(r"Expected Response:(.*?)\nActual Response:(.*?)\n---", prompt, re.S)
+        if judged:
+            expected, actual = (set(tokenize(part)) for part in judged.groups())
+            return "true" if expected and expected <= actual else "false"
+
+        # PROMPT_TEMPLATE: instruction, blank line, context, "---", then the question
+        context, _, question = prompt.rpartition("---")
+        context = context.strip().split("\n\n", 1)[-1]
+        wanted = set(tokenize(question.split(":", 1)[-1]))
+        sentences = [sentence.strip() for sentence in re.split(r"(?<=[.!?])\s+|\n{2,}", context) if sentence.strip()]
+        if not sentences:
+            return "I don't know."
+        return max(sentences, key=lambda sentence: len(wanted & set(tokenize(sentence))))
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path == "/api/embeddings":
+                    self._json({"embedding": stub.embeddings.embed_query(body.get("prompt", ""))})
+                elif self.path == "/api/embed":
+                    inputs = body.get("input", "")
+                    texts = [inputs] if isinstance(inputs, str) else inputs
+                    self._json({"embeddings": stub.embeddings.embed_documents(texts)})
+                elif self.path == "/api/generate":
+                    response = stub.generate(body.get("prompt", ""))
+                    if body.get("stream", True):
+                        # Ollama streams one JSON object per line, then a final one with done set
+                        lines = [{"response": word, "done": False} for word in re.findall(r"\S+\s*", response)]
+                        lines.append({"response": "", "done": True})
+                        self._send("application/x-ndjson", "".join(json.dumps(line) + "\n" for line in lines))
+                    else:
+                        self._json({"response": response, "done": True})
+                else:
+                    self.send_error(404)
+
+            def _json(self, payload: Dict[str, Any]):
+                self._send("application/json", json.dumps(payload))
+
+            def _send(self, content_type: str, text: str):
+                data = text.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve stub Ollama embeddings and generations for offline runs.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=STUB_PORT, help="Port to listen on (Ollama itself uses 11434).")
+    parser.add_argument("--dim", type=int, default=1024, help="Embedding dimension (mxbai-embed-large is 1024).")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds added to each generation.")
+    args = parser.parse_args()
+    server = StubOllamaServer(args.host, args.port, args.dim, args.delay)
+    print(f"🧪 Stub Ollama server on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
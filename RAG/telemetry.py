@@ -0,0 +1,241 @@
+import contextvars
+import functools
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger("RAG.telemetry")
+
+# DynamoDB operations that accept ReturnConsumedCapacity, and whether they read or write
+CAPACITY_OPERATIONS = {
+    "GetItem": "read", "BatchGetItem": "read", "Query": "read", "Scan": "read",
+    "PutItem": "write", "BatchWriteItem": "write", "DeleteItem": "write", "UpdateItem": "write",
+}
+
+
+@dataclass
+class Span:
+    name: str
+    start: float
+    duration: float = 0.0
+    parent: Optional[str] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+
+class Sink:
+    """Receives every finished span and every metric; subclass and pass to add_sink"""
+
+    def on_span(self, span: Span):
+        pass
+
+    def on_metric(self, name: str, value: float, attributes: Dict[str, Any]):
+        pass
+
+
+class LoggingSink(Sink):
+    """Logs spans and metrics to the RAG.telemetry logger at DEBUG level"""
+
+    def __init__(self, level: int = logging.DEBUG):
+        self.level = level
+
+    def on_span(self, span: Span):
+        if logger.isEnabledFor(self.level):
+            logger.log(self.level, "span %s %.2fms %s", span.name, span.duration * 1000, span.attributes)
+
+    def on_metric(self, name: str, value: float, attributes: Dict[str, Any]):
+        if logger.isEnabledFor(self.level):
+            logger.log(self.level, "metric %s %s %s", name, value, attributes)
+
+
+class OpenTelemetrySink(Sink):
+    """Forwards spans and metrics to the globally configured OpenTelemetry providers.
+
+    Needs `pip install opentelemetry-api` plus an SDK and exporter set up by the application.
+    """
+
+    def __init__(self, name: str = "RAG"):
+        from opentelemetry import metrics, trace
+        self._tracer = trace.get_tracer(name)
+        self._meter = metrics.get_meter(name)
+        self._instruments: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def on_span(self, span: Span):
+        start_ns = time.time_ns() - int((time.perf_counter() - span.start) * 1e9)
+        otel_span = self._tracer.start_span(span.name, start_time=start_ns, attributes=_flat(span.attributes))
+        otel_span.end(end_time=start_ns + int(span.duration * 1e9))
+
+    def on_metric(self, name: str, value: float, attributes: Dict[str, Any]):
+        with self._lock:
+            if name not in self._instruments:
+                self._instruments[name] = self._meter.create_counter(name)
+        self._instruments[name].add(value, attributes=_flat(attributes))
+
+
+class PrometheusSink(Sink):
+    """Exposes span durations as a histogram and metrics as counters, labelled by name.
+
+    Needs `pip install prometheus_client`; with a port, starts its HTTP exporter.
+    """
+
+    def __init__(self, port: Optional[int] = None, namespace: str = "rag"):
+        import prometheus_client
+        self._spans = prometheus_client.Histogram(
+            f"{namespace}_span_seconds", "Duration of RAG pipeline stages", ["span"])
+        self._metrics = prometheus_client.Counter(
+            f"{namespace}_metric_total", "RAG counters (capacity units, items, cache hits)", ["metric", "kind"])
+        if port is not None:
+            prometheus_client.start_http_server(port)
+
+    def on_span(self, span: Span):
+        self._spans.labels(span=span.name).observe(span.duration)
+
+    def on_metric(self, name: str, value: float, attributes: Dict[str, Any]):
+        # Only one attribute becomes a label so the series count stays bounded
+        kind = attributes.get("kind") or attributes.get("operation") or attributes.get("cache") or ""
+        self._metrics.labels(metric=name, kind=str(kind)).inc(value)
+
+
+@dataclass
+class Trace:
+    """Spans and metric totals recorded while a trace() block was active"""
+    spans: List[Span] = field(default_factory=list)
+    metrics: Dict[str, float] = field(default_factory=lambda: defaultdict(float))
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def breakdown(self) -> List[Tuple[str, float]]:
+        """(span name, total milliseconds) in the order spans first finished"""
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            totals[span.name] = totals.get(span.name, 0.0) + span.duration * 1000
+        return list(totals.items())
+
+    def summary(self) -> str:
+        lines = [f"{name:<28} {ms:>9.1f} ms" for name, ms in self.breakdown()]
+        lines += [f"{name:<28} {value:>12g}" for name, value in sorted(self.metrics.items())]
+        return "\n".join(lines)
+
+
+_sinks: List[Sink] = [LoggingSink()]
+_sinks_lock = threading.Lock()
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("rag_trace", default=None)
+_current_span: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("rag_span", default=None)
+
+
+def add_sink(sink: Sink):
+    with _sinks_lock:
+        _sinks.append(sink)
+
+
+def remove_sink(sink: Sink):
+    with _sinks_lock:
+        if sink in _sinks:
+            _sinks.remove(sink)
+
+
+def set_sinks(sinks: List[Sink]):
+    """Replace every sink, e.g. set_sinks([]) to turn telemetry off"""
+    global _sinks
+    with _sinks_lock:
+        _sinks = list(sinks)
+
+
+@contextmanager
+def trace() -> Iterator[Trace]:
+    """Collect the spans and metrics recorded inside the block, e.g. for one question"""
+    current = Trace()
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span]:
+    """Time a block; attributes can be added to the yielded span before it ends"""
+    record = Span(name, time.perf_counter(), parent=_current_span.get(), attributes=attributes)
+    token = _current_span.set(name)
+    try:
+        yield record
+    finally:
+        record.duration = time.perf_counter() - record.start
+        _current_span.reset(token)
+        current = _current_trace.get()
+        if current is not None:
+            with current._lock:
+                current.spans.append(record)
+        for sink in _sinks:
+            sink.on_span(record)
+
+
+def metric(name: str, value: float = 1, **attributes):
+    """Add to a counter, such as capacity units consumed or cache hits"""
+    current = _current_trace.get()
+    if current is not None:
+        with current._lock:
+            current.metrics[name] += value
+    for sink in _sinks:
+        sink.on_metric(name, value, attributes)
+
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    """p50/p95/p99 and mean in milliseconds of latencies given in seconds"""
+    if not latencies:
+        return {"queries": 0}
+    ms = np.asarray(latencies) * 1000
+    return {
+        "queries": len(latencies),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+    }
+
+
+def propagate(fn: Callable) -> Callable:
+    """Wrap fn to run in a copy of the caller's context, so work handed to a
+    thread pool still reports to the caller's trace"""
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+def instrument_dynamodb(client):
+    """Ask for consumed capacity on every DynamoDB call made through a client and report it"""
+    for operation in CAPACITY_OPERATIONS:
+        client.meta.events.register(f"provide-client-params.dynamodb.{operation}", _request_capacity)
+        client.meta.events.register(f"after-call.dynamodb.{operation}", _record_call)
+
+
+def _request_capacity(params, **kwargs):
+    params.setdefault("ReturnConsumedCapacity", "TOTAL")
+
+
+def _record_call(http_response, parsed, model, **kwargs):
+    operation = model.name
+    kind = CAPACITY_OPERATIONS[operation]
+    consumed = parsed.get("ConsumedCapacity") or []
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    metric("dynamodb.calls", 1, operation=operation)
+    units = sum(float(entry.get("CapacityUnits", 0)) for entry in consumed)
+    if units:
+        metric(f"dynamodb.{kind}_capacity_units", units, operation=operation)
+    if operation in ("Scan", "Query"):
+        metric("dynamodb.items_scanned", parsed.get("ScannedCount", 0), operation=operation)
+        metric("dynamodb.bytes_scanned", len(http_response.content or b""), operation=operation)
+
+
+def _flat(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    # OpenTelemetry attributes must be primitives
+    return {key: value if isinstance(value, (str, bool, int, float)) else str(value)
+            for key, value in attributes.items()}
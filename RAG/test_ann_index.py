@@ -0,0 +1,182 @@
+import os
+import numpy as np
+from RAG.ann_index import IVFIndex, _normalize_rows, _spherical_kmeans
+
+DIM = 16
+
+
+def clustered_vectors(count: int = 600, clusters: int = 6, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = _normalize_rows(rng.normal(size=(clusters, DIM)))
+    labels = rng.integers(0, clusters, count)
+    vectors = _normalize_rows(centers[labels] + 0.05 * rng.normal(size=(count, DIM)))
+    return vectors.astype(np.float32), labels
+
+
+def build_index(path, count: int = 600, nlist: int = 6):
+    vectors, _ = clustered_vectors(count)
+    items = [{'id': f"doc:{i}", 'source': f"s{i % 3}", 'vector': vectors[i].tolist()} for i in range(count)]
+    index = IVFIndex(str(path), nprobe=nlist)
+    index.build(items, nlist=nlist)
+    return index, vectors
+
+
+def assert_layout(index: IVFIndex):
+    assert index.offsets[0] == 0 and index.offsets[-1] == len(index.ids) == len(index.vectors)
+    assert np.all(np.diff(index.offsets) >= 0)
+    for j in range(index.nlist):
+        rows = np.asarray(index.vectors[index.offsets[j]:index.offsets[j + 1]])
+        if len(rows):
+            assert np.all(np.argmax(rows @ index.centroids.T, axis=1) == j)
+
+
+def test_spherical_kmeans_finds_the_clusters():
+    vectors, _ = clustered_vectors()
+    centroids = _spherical_kmeans(vectors, 6, iterations=10, seed=0)
+
+    assert centroids.shape == (6, DIM)
+    assert np.allclose(np.linalg.norm(centroids, axis=1), 1.0, atol=1e-5)
+    similarities = vectors @ centroids.T
+    # Every list gets vectors, and vectors sit close to their centroid
+    # (random centroids would give a mean best similarity around 0.4)
+    assert len(set(np.argmax(similarities, axis=1))) == 6
+    assert similarities.max(axis=1).mean() > 0.8
+    assert np.array_equal(centroids, _spherical_kmeans(vectors, 6, iterations=10, seed=0))
+
+
+def test_build_lays_vectors_out_list_by_list(tmp_path):
+    index, vectors = build_index(tmp_path)
+
+    assert index.nlist == 6 and len(index) == 600
+    assert_layout(index)
+    assert sorted(index.ids) == sorted(f"doc:{i}" for i in range(600))
+    # With every list probed the search is exact
+    doc_id, score = index.search(vectors[42], k=1)[0]
+    assert doc_id == "doc:42" and score > 0.999
+
+
+def test_tombstones_and_delta_are_logged_not_rewritten(tmp_path):
+    index, vectors = build_index(tmp_path)
+    version = index._version
+    vectors_path = os.path.join(str(tmp_path), version, 'vectors.npy')
+    modified = os.stat(vectors_path).st_mtime_ns
+
+    index.remove(["doc:1", "doc:2"])
+    index.remove_source("s0")
+    index.add(["new:0", "doc:4"], [vectors[7].tolist(), (-vectors[4]).tolist()], ["s9", "s1"])
+
+    assert index._version == version and os.stat(vectors_path).st_mtime_ns == modified
+    with open(os.path.join(str(tmp_path), version, 'log.jsonl')) as f:
+        assert len(f.readlines()) == 3
+    found = {doc_id for doc_id, _ in index.search(vectors[1], k=600)}
+    assert "doc:1" not in found and "doc:3" not in found and "new:0" in found
+    # Only the replacement vector of doc:4 is left
+    assert [doc_id for doc_id, _ in index.search(-vectors[4], k=600)].count("doc:4") == 1
+    assert index.search(-vectors[4], k=1)[0][0] == "doc:4"
+    assert len(index) == 600 - 2 - 200 + 1
+
+    reloaded = IVFIndex(str(tmp_path), nprobe=6)
+    assert reloaded.load()
+    assert len(reloaded) == len(index)
+    assert index.search(vectors[10], k=20) == reloaded.search(vectors[10], k=20)
+
+
+def test_torn_log_record_is_dropped(tmp_path):
+    index, vectors = build_index(tmp_path)
+    index.remove(["doc:5"])
+    log_path = os.path.join(str(tmp_path), index._version, 'log.jsonl')
+    with open(log_path, 'a') as f:
+        f.write('{"op": "remove", "ids": ["doc:6"')
+
+    reloaded = IVFIndex(str(tmp_path), nprobe=6)
+    assert reloaded.load()
+    found = {doc_id for doc_id, _ in reloaded.search(vectors[5], k=600)}
+    assert "doc:5" not in found and "doc:6" in found
+    reloaded.remove(["doc:7"])
+
+    again = IVFIndex(str(tmp_path), nprobe=6)
+    assert again.load() and len(again) == 598
+
+
+def test_compaction_folds_changes_into_a_new_version(tmp_path):
+    index, vectors = build_index(tmp_path)
+    old_version = index._version
+    index.remove([f"doc:{i}" for i in range(0, 600, 4)])
+    added, _ = clustered_vectors(30, seed=3)
+    index.add([f"new:{i}" for i in range(30)], added.tolist(), ["s5"] * 30)
+    before = index.search(vectors[9], k=50)
+
+    index.compact()
+
+    assert index._version != old_version
+    assert sorted(os.listdir(str(tmp_path))) == ['CURRENT', index._version]
+    assert index.alive.all() and not index.delta_ids and len(index) == 600 - 150 + 30
+    assert isinstance(index.vectors, np.memmap)
+    assert_layout(index)
+    after = index.search(vectors[9], k=50)
+    assert [doc_id for doc_id, _ in after] == [doc_id for doc_id, _ in before]
+    assert np.allclose([score for _, score in after], [score for _, score in before], atol=1e-5)
+
+    reloaded = IVFIndex(str(tmp_path), nprobe=6)
+    assert reloaded.load()
+    assert reloaded.ids == index.ids and np.array_equal(reloaded.offsets, index.offsets)
+
+
+def test_enough_pending_changes_compact_automatically(tmp_path):
+    index, vectors = build_index(tmp_path, count=600)
+    version = index._version
+    rng = np.random.default_rng(1)
+    index.add([f"new:{i}" for i in range(1001)], _normalize_rows(rng.normal(size=(1001, DIM))).tolist(), ["s7"] * 1001)
+
+    assert index._version != version
+    assert not index.delta_ids and len(index) == 1601
+    assert_layout(index)
+
+
+def test_clear_keeps_centroids(tmp_path):
+    index, vectors = build_index(tmp_path)
+    centroids = index.centroids.copy()
+    index.clear()
+
+    assert len(index) == 0 and index.search(vectors[0], k=5) == []
+    assert np.array_equal(index.centroids, centroids)
+    index.add(["a"], [vectors[0].tolist()], ["s"])
+    assert index.search(vectors[0], k=1)[0][0] == "a"
+
+
+def test_two_instances_share_one_directory(tmp_path):
+    first, vectors = build_index(tmp_path)
+    second = IVFIndex(str(tmp_path), nprobe=6)
+    assert second.load()
+
+    second.remove(["doc:1"])
+    first.add(["new:0"], [vectors[3].tolist()], ["s9"])
+    assert "doc:1" not in {doc_id for doc_id, _ in first.search(vectors[1], k=600)}
+
+    # first moves CURRENT to a new version and drops the one second appends to
+    first.compact()
+    second.add(["new:1"], [vectors[4].tolist()], ["s9"])
+    assert second._version == first._version
+    found = {doc_id for doc_id, _ in second.search(vectors[3], k=600)}
+    assert "new:0" in found and "new:1" in found and "doc:1" not in found
+
+    reloaded = IVFIndex(str(tmp_path), nprobe=6)
+    assert reloaded.load() and len(reloaded) == 600 - 1 + 2
+
+
+def test_ensure_loaded_rebuilds_when_the_table_count_differs(tmp_path):
+    index, vectors = build_index(tmp_path)
+    other = IVFIndex(str(tmp_path), nprobe=6)
+    assert other.load()
+    builds = []
+
+    # Changes appended by another instance are picked up before counting
+    other.add(["new:0"], [vectors[0].tolist()], ["s9"])
+    index.checked_at = None
+    index.ensure_loaded(lambda: builds.append(1), table_count=lambda: 601)
+    assert not builds and len(index) == 601
+
+    index.ensure_loaded(lambda: builds.append(1), table_count=lambda: 0)
+    assert not builds
+    index.ensure_loaded(lambda: builds.append(1), table_count=lambda: 0, max_age=0)
+    assert builds == [1]
@@ -1,12 +1,5 @@
-from query_data import query_rag
-from langchain_community.llms.ollama import Ollama
-
-EVAL_PROMPT = """
-Expected Response: {expected_response}
-Actual Response: {actual_response}
----
-(Answer with 'true' or 'false') Does the actual response match the expected response? 
-"""
+from RAG.query_data import query_rag
+from RAG.evaluation import judge
 
 def test_monopoly_rules():
     assert query_and_validate(
@@ -22,23 +15,15 @@ def test_ticket_to_ride_rules():
 
 def query_and_validate(question: str, expected_response: str):
     response_text = query_rag(question)
-    prompt = EVAL_PROMPT.format(
-        expected_response=expected_response, actual_response=response_text
-    )
-
-    model = Ollama(model="llama3.1")
-    evaluation_results_str = model.invoke(prompt)
-    evaluation_results_str_cleaned = evaluation_results_str.strip().lower()
-
-    print(prompt)
+    passed = judge(expected_response, response_text)
 
-    if "true" in evaluation_results_str_cleaned:
+    if passed:
         # Print response in Green if it is correct.
-        print("\033[92m" + f"Response: {evaluation_results_str_cleaned}" + "\033[0m")
+        print("\033[92m" + f"Response: {response_text}" + "\033[0m")
         return True
-    elif "false" in evaluation_results_str_cleaned:
+    elif passed is False:
         # Print response in Red if it is incorrect.
-        print("\033[91m" + f"Response: {evaluation_results_str_cleaned}" + "\033[0m")
+        print("\033[91m" + f"Response: {response_text}" + "\033[0m")
         return False
     else:
         raise ValueError(
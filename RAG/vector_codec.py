@@ -0,0 +1,52 @@
+from decimal import Decimal
+from typing import Any, Dict, List, Tuple
+import numpy as np
+
+# Values of the `vector_version` attribute. Items written before the attribute
+# existed have no version and hold a list of Decimals.
+VECTOR_VERSIONS = {
+    'list': 1,
+    'float32': 2,
+    'float16': 3,
+}
+
+# Packed formats are always little-endian so items read the same on any host
+_DTYPES = {
+    2: np.dtype('<f4'),
+    3: np.dtype('<f2'),
+}
+
+
+def encode_vector(embedding: List[float], vector_format: str = 'list') -> Tuple[Any, int]:
+    """Encode an embedding as a DynamoDB attribute value and return it with its version"""
+    if vector_format not in VECTOR_VERSIONS:
+        raise ValueError(f"Unknown vector format '{vector_format}', expected one of {list(VECTOR_VERSIONS)}")
+
+    version = VECTOR_VERSIONS[vector_format]
+    if version == 1:
+        return [Decimal(str(x)) for x in embedding], version
+    return np.asarray(embedding, dtype=_DTYPES[version]).tobytes(), version
+
+
+def decode_vector(item: Dict[str, Any]) -> np.ndarray:
+    """Decode the vector of an EMBEDDINGS item in any supported format to float32"""
+    version = int(item.get('vector_version', 1))
+    value = item['vector']
+
+    if version == 1:
+        return np.array([float(x) for x in value], dtype=np.float32)
+    if version not in _DTYPES:
+        raise ValueError(f"Unknown vector version {version}")
+
+    # boto3 wraps binary attributes in boto3.dynamodb.types.Binary
+    raw = getattr(value, 'value', value)
+    return np.frombuffer(raw, dtype=_DTYPES[version]).astype(np.float32)
+
+
+def vector_format_of(item: Dict[str, Any]) -> str:
+    """Name of the format an item's vector is stored in"""
+    version = int(item.get('vector_version', 1))
+    for name, value in VECTOR_VERSIONS.items():
+        if value == version:
+            return name
+    raise ValueError(f"Unknown vector version {version}")
@@ -0,0 +1,482 @@
+import json
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from RAG.vector_codec import decode_vector
+from RAG.search_filter import SearchFilter
+
+QUANTIZATIONS = (None, 'int8')
+
+# Quantized codes are widened to float32 this many rows at a time while scoring
+_SCORE_BLOCK = 16384
+# Batch searches score this many queries per matrix-matrix product, bounding the score matrix
+QUERY_BLOCK = 256
+
+# Turns rankings of (ID, score) into (Document, score) lists, e.g. by fetching the items by key
+FetchDocuments = Callable[[List[List[Tuple[str, float]]]], List[List[Tuple[Document, float]]]]
+
+
+def item_document(doc_id: str, content: str, metadata: Optional[str]) -> Document:
+    """Build a Document from a stored chunk; metadata['id'] is always the item's key,
+    so results from different rankings can be matched up"""
+    fields = json.loads(metadata or '{}')
+    fields['id'] = doc_id
+    return Document(page_content=content, metadata=fields)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, without a full sort"""
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def mmr(query: np.ndarray, vectors: np.ndarray, k: int, lambda_mult: float = 0.5,
+        relevance: Optional[np.ndarray] = None) -> List[int]:
+    """Maximal marginal relevance: pick k rows that are relevant to the query but not to each other.
+
+    Rows and query are normalized first. One matrix product gives every
+    pairwise similarity; each step then updates a running "most similar
+    selected row" vector instead of looping over pairs. relevance overrides
+    the cosine similarity to the query, e.g. with fused hybrid scores.
+    """
+    if len(vectors) == 0 or k <= 0:
+        return []
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix = vectors / norms
+    if relevance is None:
+        query_norm = np.linalg.norm(query)
+        relevance = matrix @ (query / query_norm if query_norm else query)
+    similarity = matrix @ matrix.T
+
+    selected = [int(np.argmax(relevance))]
+    closest = similarity[selected[0]].copy()
+    available = np.ones(len(matrix), dtype=bool)
+    available[selected[0]] = False
+    while len(selected) < min(k, len(matrix)):
+        scores = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * closest, -np.inf)
+        pick = int(np.argmax(scores))
+        selected.append(pick)
+        available[pick] = False
+        np.maximum(closest, similarity[pick], out=closest)
+    return selected
+
+
+class VectorIndex:
+    """In-memory, pre-normalized matrix of the vectors in one table.
+
+    By default rows are float32 and each row's content and metadata are kept
+    alongside. With quantization='int8' each row is stored as int8 codes plus
+    one float32 scale, a quarter of the memory, and only IDs, sources and
+    pages stay resident; searches then score on the codes, rerank a shortlist
+    with full-precision vectors and fetch the content of the final k by ID.
+    """
+
+    def __init__(self, quantization: Optional[str] = None):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization '{quantization}', expected one of {list(QUANTIZATIONS)}")
+        self.quantization = quantization
+        self._dtype = np.int8 if quantization == 'int8' else np.float32
+        self._lock = threading.RLock()
+        # Held for a whole load; searches only take _lock, so they go on during a reload
+        self._load_lock = threading.RLock()
+        self.loaded = False
+        # time.monotonic() of the last full load, for callers that reload after a TTL
+        self.loaded_at = 0.0
+        self._matrix = np.zeros((0, 0), dtype=self._dtype)
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._pages = np.zeros(0, dtype=np.int64)
+        self._size = 0
+        self.ids: List[str] = []
+        self.sources: List[str] = []
+        # (content, metadata JSON) kept raw; Documents are only built for results.
+        # Left empty by a quantized index, whose results are fetched by ID
+        self.keeps_payloads = quantization is None
+        self._payloads: List[Tuple[str, str]] = []
+        self._positions: Dict[str, int] = {}
+        # Changes made while a load reads the table, replayed onto the loaded rows
+        self._changes: Optional[List[Callable[['VectorIndex'], Any]]] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the rows: vectors, scales, pages and the resident strings"""
+        with self._lock:
+            arrays = self._matrix[:self._size].nbytes + self._scales[:self._size].nbytes + self._pages[:self._size].nbytes
+            strings = sum(sys.getsizeof(value) for value in self.ids) + sum(sys.getsizeof(value) for value in self.sources)
+            strings += sum(sys.getsizeof(content) + sys.getsizeof(metadata) for content, metadata in self._payloads)
+            return arrays + strings
+
+    @property
+    def loading(self) -> bool:
+        return self._changes is not None
+
+    def load(self, items: Iterable[Dict[str, Any]]):
+        """Replace the index contents with the given EMBEDDINGS items.
+
+        The items are read into a new index while searches keep using the
+        current rows, which are swapped for the new ones at the end, with any
+        add or remove made meanwhile applied to them. If reading fails the
+        current rows are kept.
+        """
+        with self._load_lock:
+            fresh = VectorIndex(self.quantization)
+            with self._lock:
+                self._changes = []
+            try:
+                for item in items:
+                    fresh._upsert(item['id'], decode_vector(item), item.get('source', ''), item.get('page', 0),
+                                  item.get('content', ''), item.get('metadata', '{}'))
+            except BaseException:
+                with self._lock:
+                    self._changes = None
+                raise
+
+            fresh.loaded = True
+            with self._lock:
+                for change in self._changes:
+                    change(fresh)
+                self._changes = None
+                self._matrix, self._scales, self._pages = fresh._matrix, fresh._scales, fresh._pages
+                self._size, self.ids, self.sources = fresh._size, fresh.ids, fresh.sources
+                self._payloads, self._positions = fresh._payloads, fresh._positions
+                # An invalidate() during the load leaves the index marked stale
+                self.loaded = fresh.loaded
+                self.loaded_at = time.monotonic()
+
+    def ensure_loaded(self, load: Callable[[], Any], max_age: Optional[float] = None):
+        """Call load() unless the index is loaded (less than max_age seconds ago, if given).
+
+        Concurrent callers of a first load wait for it; once the index is
+        loaded, callers that find it expired while another one reloads it
+        search the current rows instead of waiting.
+        """
+        if self._fresh(max_age):
+            return
+        if not self._load_lock.acquire(blocking=not self.loaded):
+            return
+        try:
+            if not self._fresh(max_age):
+                load()
+        finally:
+            self._load_lock.release()
+
+    def _fresh(self, max_age: Optional[float]) -> bool:
+        return self.loaded and (max_age is None or time.monotonic() - self.loaded_at < max_age)
+
+    def add(self, ids: List[str], embeddings: List[List[float]], documents: List[Document]):
+        """Insert or replace rows for freshly written documents"""
+        with self._lock:
+            self._record(lambda index: index.add(ids, embeddings, documents))
+            for doc_id, embedding, doc in zip(ids, embeddings, documents):
+                self._upsert(doc_id, np.asarray(embedding, dtype=np.float32), doc.metadata.get('source', ''),
+                             doc.metadata.get('page', 0), doc.page_content, json.dumps(doc.metadata))
+
+    def remove(self, ids: Iterable[str]):
+        """Drop rows by document ID"""
+        ids = list(ids)
+        with self._lock:
+            self._record(lambda index: index.remove(ids))
+            rows = {self._positions[doc_id] for doc_id in ids if doc_id in self._positions}
+            if rows:
+                self._compact(rows)
+
+    def remove_source(self, source: str):
+        """Drop every row that came from a source file"""
+        with self._lock:
+            self._record(lambda index: index.remove_source(source))
+            rows = {row for row, row_source in enumerate(self.sources) if row_source == source}
+            if rows:
+                self._compact(rows)
+
+    def clear(self):
+        """Empty the index while keeping it marked as loaded"""
+        with self._lock:
+            self._record(VectorIndex.clear)
+            self._matrix = np.zeros((0, self._matrix.shape[1]), dtype=self._dtype)
+            self._scales = np.zeros(0, dtype=np.float32)
+            self._pages = np.zeros(0, dtype=np.int64)
+            self._size = 0
+            self.ids = []
+            self.sources = []
+            self._payloads = []
+            self._positions = {}
+
+    def invalidate(self):
+        """Mark the index as out of step with the table so the next search reloads it"""
+        with self._lock:
+            self._record(VectorIndex.invalidate)
+            self.loaded = False
+
+    def _record(self, change: Callable[['VectorIndex'], Any]):
+        if self._changes is not None:
+            self._changes.append(change)
+
+    def search(self, query_embedding: List[float], k: int = 5,
+               fetch_vectors: Optional[Callable[[List[str]], Dict[str, np.ndarray]]] = None,
+               rerank_factor: int = 4, search_filter: Optional[SearchFilter] = None,
+               fetch_documents: Optional[FetchDocuments] = None) -> List[Tuple[Document, float]]:
+        """Score every row with one matrix-vector product and return the top k.
+
+        For a quantized index the top k * rerank_factor rows by approximate score
+        are rescored exactly with vectors from fetch_vectors, when given, and
+        the winners' Documents come from fetch_documents. Rows not matching
+        search_filter are dropped before scoring.
+        """
+        self._check_fetch_documents(fetch_documents)
+        with self._lock:
+            if self._size == 0 or k <= 0:
+                return []
+
+            rows = self._filter_rows(search_filter) if search_filter else None
+            if rows is not None and len(rows) == 0:
+                return []
+
+            query = self._normalize(np.asarray(query_embedding, dtype=np.float32))
+            scores = self._score(query, rows)
+            if rows is None:
+                rows = np.arange(self._size)
+
+            if self.quantization and fetch_vectors is not None:
+                shortlist = rows[top_k(scores, k * rerank_factor)]
+                ids = [self.ids[row] for row in shortlist]
+            else:
+                top = top_k(scores, k)
+                if self.keeps_payloads:
+                    return [(self.document(rows[i]), float(scores[i])) for i in top]
+                hits = [(self.ids[rows[i]], float(scores[i])) for i in top]
+
+        # Fetch outside the lock so other searches are not held up by the network call
+        if self.quantization and fetch_vectors is not None:
+            vectors = fetch_vectors(ids)
+            exact = np.array([
+                float(self._normalize(vectors[doc_id]) @ query) if doc_id in vectors else -np.inf
+                for doc_id in ids
+            ], dtype=np.float32)
+            hits = [(ids[i], float(exact[i])) for i in top_k(exact, k) if np.isfinite(exact[i])]
+        return self._documents([hits], fetch_documents)[0]
+
+    def search_batch(self, query_embeddings: List[List[float]], k: int = 5,
+                     fetch_vectors: Optional[Callable[[List[str]], Dict[str, np.ndarray]]] = None,
+                     rerank_factor: int = 4, search_filter: Optional[SearchFilter] = None,
+                     fetch_documents: Optional[FetchDocuments] = None) -> List[List[Tuple[Document, float]]]:
+        """search() for many queries at once: the top k of each, in query order.
+
+        Queries are scored QUERY_BLOCK at a time with one matrix-matrix product,
+        and a quantized index fetches the vectors of every shortlist, then the
+        Documents of every result, in one call each.
+        """
+        self._check_fetch_documents(fetch_documents)
+        results: List[List[Tuple[Document, float]]] = [[] for _ in query_embeddings]
+        rankings: List[List[Tuple[str, float]]] = [[] for _ in query_embeddings]
+        with self._lock:
+            if self._size == 0 or k <= 0 or not query_embeddings:
+                return results
+
+            rows = self._filter_rows(search_filter) if search_filter else None
+            if rows is not None and len(rows) == 0:
+                return results
+
+            queries = np.asarray(query_embeddings, dtype=np.float32)
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            queries = queries / norms
+            if rows is None:
+                rows = np.arange(self._size)
+
+            shortlists = []
+            for start in range(0, len(queries), QUERY_BLOCK):
+                scores = self._score(queries[start:start + QUERY_BLOCK].T, None if len(rows) == self._size else rows)
+                for column in range(scores.shape[1]):
+                    if self.quantization and fetch_vectors is not None:
+                        shortlists.append(rows[top_k(scores[:, column], k * rerank_factor)])
+                    elif self.keeps_payloads:
+                        top = top_k(scores[:, column], k)
+                        results[start + column] = [(self.document(rows[i]), float(scores[i, column])) for i in top]
+                    else:
+                        top = top_k(scores[:, column], k)
+                        rankings[start + column] = [(self.ids[rows[i]], float(scores[i, column])) for i in top]
+            if self.keeps_payloads and not shortlists:
+                return results
+            ids = [[self.ids[row] for row in shortlist] for shortlist in shortlists]
+
+        if shortlists:
+            # One fetch for every shortlist, outside the lock
+            vectors = fetch_vectors(list(dict.fromkeys(doc_id for row_ids in ids for doc_id in row_ids)))
+            normalized = {doc_id: self._normalize(vector) for doc_id, vector in vectors.items()}
+            for position, (query, row_ids) in enumerate(zip(queries, ids)):
+                exact = np.array([
+                    float(normalized[doc_id] @ query) if doc_id in normalized else -np.inf
+                    for doc_id in row_ids
+                ], dtype=np.float32)
+                rankings[position] = [(row_ids[i], float(exact[i])) for i in top_k(exact, k) if np.isfinite(exact[i])]
+        return self._documents(rankings, fetch_documents)
+
+    def vectors(self, ids: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Normalized float32 vectors of the given IDs that are in the index (approximate if quantized)"""
+        with self._lock:
+            found = {}
+            for doc_id in ids:
+                row = self._positions.get(doc_id)
+                if row is not None:
+                    vector = self._matrix[row].astype(np.float32)
+                    found[doc_id] = vector * self._scales[row] if self.quantization else vector
+            return found
+
+    def document(self, row: int) -> Document:
+        """Build the Document for a row of an index that keeps payloads"""
+        content, metadata = self._payloads[row]
+        return item_document(self.ids[row], content, metadata)
+
+    def _check_fetch_documents(self, fetch_documents: Optional[FetchDocuments]):
+        if not self.keeps_payloads and fetch_documents is None:
+            raise ValueError("A quantized index keeps no content; pass fetch_documents to search it")
+
+    def _documents(self, rankings: List[List[Tuple[str, float]]],
+                   fetch_documents: Optional[FetchDocuments]) -> List[List[Tuple[Document, float]]]:
+        """Documents for ranked IDs, from the resident payloads or through fetch_documents"""
+        if not self.keeps_payloads:
+            return fetch_documents(rankings)
+        with self._lock:
+            # Rows removed since they were ranked are dropped
+            return [[(self.document(self._positions[doc_id]), score) for doc_id, score in hits if doc_id in self._positions]
+                    for hits in rankings]
+
+    def can_filter(self, search_filter: Optional[SearchFilter]) -> bool:
+        """Whether searches with this filter can run on the index; metadata tests need the payloads"""
+        return search_filter is None or self.keeps_payloads or not search_filter.needs_metadata
+
+    def _filter_rows(self, search_filter: SearchFilter) -> np.ndarray:
+        """Row numbers matching a filter; sources and pages are tested without decoding metadata"""
+        if not self.can_filter(search_filter):
+            raise ValueError("A quantized index keeps no metadata to filter on")
+        mask = np.ones(self._size, dtype=bool)
+        if search_filter.sources is not None:
+            wanted = set(search_filter.sources)
+            mask &= np.fromiter((source in wanted for source in self.sources), dtype=bool, count=self._size)
+        if search_filter.pages is not None:
+            pages = self._pages[:self._size]
+            in_range = np.zeros(self._size, dtype=bool)
+            for first, last in search_filter.pages:
+                in_range |= (pages >= first) & (pages <= last)
+            mask &= in_range
+
+        rows = np.flatnonzero(mask)
+        if search_filter.needs_metadata:
+            rows = np.array([row for row in rows if search_filter.matches(
+                self.sources[row], self._pages[row], self._payloads[row][1])], dtype=np.int64)
+        return rows
+
+    def _score(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Cosine score of every row (or the given rows) against a normalized query,
+        or against each column of a (dim, queries) matrix of them"""
+        if not self.quantization:
+            matrix = self._matrix[:self._size] if rows is None else self._matrix[rows]
+            return matrix @ query
+
+        # Widen codes block by block so no float copy of the whole matrix is made
+        count = self._size if rows is None else len(rows)
+        scores = np.empty((count,) + query.shape[1:], dtype=np.float32)
+        for start in range(0, count, _SCORE_BLOCK):
+            end = min(start + _SCORE_BLOCK, count)
+            block = slice(start, end) if rows is None else rows[start:end]
+            scales = self._scales[block] if query.ndim == 1 else self._scales[block, None]
+            scores[start:end] = (self._matrix[block].astype(np.float32) @ query) * scales
+        return scores
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        norm = np.linalg.norm(vector)
+        # Zero vectors score 0 against everything
+        return vector / norm if norm else vector
+
+    def _upsert(self, doc_id: str, vector: np.ndarray, source: str, page: Any, content: str, metadata: str):
+        vector = self._normalize(vector)
+        if doc_id in self._positions:
+            row = self._positions[doc_id]
+        else:
+            row = self._size
+            self._reserve(row + 1, len(vector))
+            self._size += 1
+            self.ids.append(doc_id)
+            self.sources.append(source)
+            if self.keeps_payloads:
+                self._payloads.append((content, metadata))
+            self._positions[doc_id] = row
+
+        if self.quantization:
+            # Symmetric per-row scale maps the largest component to +-127
+            scale = float(np.abs(vector).max()) / 127 if len(vector) else 0.0
+            self._matrix[row] = np.round(vector / scale) if scale else 0
+            self._scales[row] = scale
+        else:
+            self._matrix[row] = vector
+        self._pages[row] = int(page or 0)
+        self.sources[row] = source
+        if self.keeps_payloads:
+            self._payloads[row] = (content, metadata)
+
+    def _reserve(self, rows: int, dim: int):
+        """Grow the matrix geometrically so appends stay amortized O(1)"""
+        if self._size == 0 and self._matrix.shape[1] != dim:
+            self._matrix = np.zeros((0, dim), dtype=self._dtype)
+        if self._matrix.shape[1] != dim:
+            raise ValueError(f"Vector dimension {dim} does not match index dimension {self._matrix.shape[1]}")
+        if rows <= self._matrix.shape[0]:
+            return
+
+        capacity = max(rows, 2 * self._matrix.shape[0], 64)
+        grown = np.zeros((capacity, dim), dtype=self._dtype)
+        grown[:self._size] = self._matrix[:self._size]
+        self._matrix = grown
+        scales = np.zeros(capacity, dtype=np.float32)
+        scales[:self._size] = self._scales[:self._size]
+        self._scales = scales
+        pages = np.zeros(capacity, dtype=np.int64)
+        pages[:self._size] = self._pages[:self._size]
+        self._pages = pages
+
+    def _compact(self, removed_rows: set):
+        keep = [row for row in range(self._size) if row not in removed_rows]
+        self._matrix = np.ascontiguousarray(self._matrix[keep])
+        self._scales = self._scales[keep]
+        self._pages = self._pages[keep]
+        self._size = len(keep)
+        self.ids = [self.ids[row] for row in keep]
+        self.sources = [self.sources[row] for row in keep]
+        if self.keeps_payloads:
+            self._payloads = [self._payloads[row] for row in keep]
+        self._positions = {doc_id: row for row, doc_id in enumerate(self.ids)}
+
+
+# One index per (table, local, quantization) shared by every store in the
+# process, so writes made through one DynamoDBVectorStore are visible to
+# searches through another
+_shared_indexes: Dict[Tuple[str, bool, Optional[str]], VectorIndex] = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_index(table_name: str, local: bool, quantization: Optional[str] = None) -> VectorIndex:
+    """Return the process-wide index for a table, creating it empty if needed"""
+    with _shared_lock:
+        key = (table_name, local, quantization)
+        if key not in _shared_indexes:
+            _shared_indexes[key] = VectorIndex(quantization)
+        return _shared_indexes[key]
+
+
+def find_shared_indexes(table_name: str, local: bool) -> List[VectorIndex]:
+    """Return every loaded (or loading) process-wide index for a table, in any quantization"""
+    with _shared_lock:
+        return [
+            index for (name, is_local, _), index in _shared_indexes.items()
+            if name == table_name and is_local == local and (index.loaded or index.loading)
+        ]
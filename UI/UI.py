@@ -8,6 +8,7 @@ sys.path.append(ROOT_DIR)
 # Import RAG
 from RAG import query_data
 from RAG import populate_database
+from RAG import telemetry
 import Send_Email
 from MCP.aws_mcp_server import AWSMCPServer
 
@@ -27,8 +28,17 @@ if "email_set" not in st.session_state:
 if "aws_mode" not in st.session_state:
     st.session_state.aws_mode = False
 
+if "last_timing" not in st.session_state:
+    st.session_state.last_timing = ""
+
+@st.cache_resource
+def get_mcp_server():
+    # One server for every browser session; its AWS and Ollama clients come
+    # from the process-wide registry in RAG.resources
+    return AWSMCPServer()
+
 if "mcp_server" not in st.session_state:
-    st.session_state.mcp_server = AWSMCPServer()
+    st.session_state.mcp_server = get_mcp_server()
 
 def handle_message(message: str):
     if not message.strip():
@@ -47,9 +57,19 @@ def handle_message(message: str):
             else:
                 bot_reply = f"**AWS Operation Failed:**\n{result.get('message', 'Unknown error')}"
     else:
-        # Generate Response through RAG & LLM
-        with st.spinner("Generating response..."):
-            bot_reply = query_data.query_rag(message)  # This might take time
+        # Generate Response through RAG & LLM, showing tokens as they arrive
+        with telemetry.trace() as question_trace:
+            with st.spinner("Searching documents..."):
+                sources, tokens = query_data.stream_rag(message)
+            st.markdown(f"**👤 You:**  **{message}**")
+            placeholder = st.empty()
+            bot_reply = ""
+            for token in tokens:
+                bot_reply += token
+                placeholder.markdown(f"*🤖 BOT:* {bot_reply}▌")
+            placeholder.markdown(f"*🤖 BOT:* {bot_reply}")
+        st.session_state.last_timing = question_trace.summary()
+        print(f"Response: {bot_reply}\nSources: {sources}")
 
     # For Keeping Chat History 
     st.session_state.chat_history.append(("BOT:", bot_reply))
@@ -110,6 +130,9 @@ with st.sidebar:
     else:
         st.success(f"Email: {st.session_state.user_email}")
 
+    # Where the time of the last answer went (embedding, search, generation, ...)
+    show_timing = st.checkbox("⏱️ Show timing breakdown", value=False)
+
    
 # Main chat area
 st.subheader("💬 Conversation")
@@ -119,6 +142,10 @@ for sender, message in st.session_state.chat_history:
     else:
         st.markdown(f"*🤖 BOT:* {message}")
 
+if show_timing and st.session_state.last_timing:
+    with st.expander("⏱️ Timing breakdown of the last answer", expanded=True):
+        st.code(st.session_state.last_timing)
+
 # AWS Operations Toggle
 st.session_state.aws_mode = st.checkbox(
     "🔧 AWS Operations Mode", 
@@ -0,0 +1,41 @@
+import argparse
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from RAG.dynamodb_vector_store import DynamoDBVectorStore
+from RAG.ann_index import ANN_INDEX_PATH, recall_report
+from RAG.vector_codec import decode_vector
+
+def ann_report():
+    """Build the IVF index from EMBEDDINGS and compare its recall@k against brute force"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index-path", default=ANN_INDEX_PATH, help="Directory to save the IVF index in.")
+    parser.add_argument("--nlist", type=int, default=None, help="Number of lists (default: sqrt of corpus size).")
+    parser.add_argument("-k", type=int, default=5, help="Neighbours per query.")
+    parser.add_argument("--queries", type=int, default=100, help="Number of sampled queries.")
+    parser.add_argument("--aws", action="store_true", help="Use AWS DynamoDB instead of DynamoDB Local.")
+    args = parser.parse_args()
+
+    db = DynamoDBVectorStore(local=not args.aws, ann_index_path=args.index_path)
+
+    print("🔨 Building IVF index...")
+    index = db.build_ann_index(nlist=args.nlist)
+    print(f"✅ Indexed {len(index)} vectors in {index.nlist} lists at {args.index_path}")
+    if len(index) == 0:
+        print("❌ No embeddings found in DynamoDB")
+        return
+
+    ids, vectors = [], []
+    for item in db._scan(ProjectionExpression='id, vector, vector_version'):
+        ids.append(item['id'])
+        vectors.append(decode_vector(item))
+
+    print(f"\n📊 recall@{args.k} over {min(args.queries, len(ids))} queries (nprobe 0 = brute force)")
+    print(f"  {'nprobe':>6}  {'recall':>7}  {'ms/query':>9}")
+    for row in recall_report(ids, np.vstack(vectors), index, k=args.k, queries=args.queries):
+        print(f"  {row['nprobe']:>6}  {row['recall']:>7.3f}  {row['latency_ms']:>9.3f}")
+
+if __name__ == "__main__":
+    ann_report()
@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from langchain_core.documents import Document
+from RAG.dynamodb_vector_store import DynamoDBVectorStore
+from RAG.pipeline import IngestionPipeline
+from RAG.resources import get_registry
+from RAG.schema import embeddings_table_definition
+from RAG.stubs import HashEmbeddings
+from RAG import telemetry
+from RAG.telemetry import percentiles
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_TABLE = "EMBEDDINGS_BENCH"
+WORDS_PER_CHUNK = 120
+VOCABULARY_SIZE = 5000
+
+# Search paths compared at every corpus size: (name, DynamoDBVectorStore options)
+SEARCH_MODES = [
+    ("scan", {}),
+    ("index", {"in_memory_index": True}),
+    ("int8", {"quantization": "int8"}),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion and retrieval against a synthetic corpus.")
+    parser.add_argument("--sizes", default="1000,5000,10000", help="Comma-separated corpus sizes, measured in increasing order.")
+    parser.add_argument("--dim", type=int, default=1024, help="Embedding dimension (mxbai-embed-large is 1024).")
+    parser.add_argument("--sources", type=int, default=20, help="Number of synthetic source files.")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per search mode and corpus size.")
+    parser.add_argument("--scan-queries", type=int, default=20, help="Queries for the full-scan search mode, which is slow.")
+    parser.add_argument("-k", type=int, default=5, help="Results per query.")
+    # moto serializes every number of a 'list' vector separately, which dominates its timings
+    parser.add_argument("--vector-format", default="float32", help="Vector storage format for written items.")
+    parser.add_argument("--backend", choices=["moto", "local"], default="moto",
+                        help="In-process moto stand-in, or DynamoDB Local on port 8000.")
+    parser.add_argument("--table", default=BENCH_TABLE, help="Table to create for the run (dropped afterwards).")
+    parser.add_argument("--keep-table", action="store_true", help="Do not drop the table after the run.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the corpus and query sample.")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results.")
+    args = parser.parse_args()
+
+    if args.backend == "moto":
+        try:
+            from moto import mock_aws
+        except ImportError:
+            sys.exit("❌ The moto backend needs `pip install moto`; use --backend local for DynamoDB Local")
+        # moto never checks credentials, but boto3 still needs some to sign requests
+        os.environ.setdefault("AWS_ACCESS_KEY_ID", "fake")
+        os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "fake")
+        with mock_aws():
+            results = run_benchmark(args, local=False)
+    else:
+        results = run_benchmark(args, local=True)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print_summary(results)
+    print(f"\n💾 Results written to {args.output}")
+
+
+def run_benchmark(args, local: bool) -> Dict[str, Any]:
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    client = get_registry().client("dynamodb", local=local)
+    create_table(client, args.table)
+    embeddings = HashEmbeddings(args.dim)
+    rng = random.Random(args.seed)
+    corpus = SyntheticCorpus(args.sources, args.seed)
+
+    results: Dict[str, Any] = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "runs": [],
+    }
+
+    db = DynamoDBVectorStore(table_name=args.table, local=local, vector_format=args.vector_format)
+    try:
+        documents: List[Document] = []
+        for size in sizes:
+            print(f"📦 Corpus size {size}")
+            run: Dict[str, Any] = {"corpus_size": size}
+
+            # Grow the table to `size` items through the ingestion pipeline
+            batch = corpus.chunks(len(documents), size - len(documents))
+            documents.extend(batch)
+            with measure() as capacity:
+                report = IngestionPipeline(db, embeddings).run([batch])
+            run["ingest"] = {
+                "items": len(batch),
+                "seconds": report.wall_seconds,
+                "items_per_second": len(batch) / report.wall_seconds if report.wall_seconds else 0.0,
+                "failed": len(report.writes.failed),
+                "stages": {name: {"items": stats.items, "busy_seconds": stats.busy_seconds}
+                           for name, stats in report.stages.items()},
+                "capacity": capacity,
+            }
+
+            with measure() as capacity:
+                started = time.perf_counter()
+                scanned = sum(1 for _ in db._scan())
+                seconds = time.perf_counter() - started
+            run["scan"] = {"items": scanned, "seconds": seconds, "capacity": capacity}
+
+            targets = [rng.choice(documents) for _ in range(args.queries)]
+            query_vectors = embeddings.embed_documents([corpus.query(target) for target in targets])
+            run["search"] = {}
+            for name, options in SEARCH_MODES:
+                store = DynamoDBVectorStore(table_name=args.table, local=local, **options)
+                mode: Dict[str, Any] = {}
+                if store.in_memory_index:
+                    started = time.perf_counter()
+                    index = store.refresh_index()
+                    mode["index_load_seconds"] = time.perf_counter() - started
+                    mode["index_bytes"] = index.nbytes
+                count = args.scan_queries if name == "scan" else args.queries
+                with measure() as capacity:
+                    latencies = []
+                    hits = 0
+                    for vector, target in zip(query_vectors[:count], targets):
+                        started = time.perf_counter()
+                        results_k = store.similarity_search_with_score(vector, k=args.k)
+                        latencies.append(time.perf_counter() - started)
+                        hits += any(doc.metadata.get("id") == target.metadata["id"] for doc, _score in results_k)
+                mode.update(percentiles(latencies))
+                # Share of queries whose originating chunk came back in the top k
+                mode["hit_rate"] = hits / len(latencies) if latencies else 0.0
+                mode["capacity"] = capacity
+                run["search"][name] = mode
+
+            run["memory"] = {"peak_rss_bytes": peak_rss()}
+            results["runs"].append(run)
+    finally:
+        if not args.keep_table:
+            client.delete_table(TableName=args.table)
+
+    return results
+
+
+class SyntheticCorpus:
+    """Reproducible chunks of pseudo-words, each source favouring its own slice of the vocabulary"""
+
+    def __init__(self, sources: int, seed: int = 0):
+        self.sources = sources
+        self.seed = seed
+        self.vocabulary = [f"term{i}" for i in range(VOCABULARY_SIZE)]
+
+    def chunks(self, start: int, count: int) -> List[Document]:
+        documents = []
+        for number in range(start, start + count):
+            # Each chunk has its own generator so chunk n is the same whatever the sizes
+            rng = random.Random(self.seed * 1_000_003 + number)
+            source_number = number % self.sources
+            topic = self.vocabulary[source_number::self.sources]
+            words = [rng.choice(topic) if rng.random() < 0.5 else rng.choice(self.vocabulary)
+                     for _ in range(WORDS_PER_CHUNK)]
+            source = f"data/synthetic_{source_number:03d}.pdf"
+            page = (number // self.sources) // 4
+            metadata = {"source": source, "page": page, "id": f"{source}:{page}:{number}"}
+            documents.append(Document(page_content=" ".join(words), metadata=metadata))
+        return documents
+
+    @staticmethod
+    def query(document: Document, words: int = 12) -> str:
+        # A run of words lifted from a chunk, so every query has a known best match
+        tokens = document.page_content.split()
+        start = len(tokens) // 3
+        return " ".join(tokens[start:start + words])
+
+
+@contextmanager
+def measure():
+    """Yield a dict that is filled with the DynamoDB totals (capacity units,
+    calls, items and bytes scanned) of the calls made inside the block"""
+    totals: Dict[str, float] = {}
+    with telemetry.trace() as block:
+        yield totals
+    totals.update({name[len("dynamodb."):]: value for name, value in block.metrics.items()
+                   if name.startswith("dynamodb.")})
+
+
+def peak_rss() -> int:
+    if resource is None:
+        return 0
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def create_table(client, table_name: str):
+    definition = embeddings_table_definition(table_name)
+    client.create_table(**definition)
+    client.get_waiter("table_exists").wait(TableName=table_name)
+
+
+def print_summary(results: Dict[str, Any]):
+    print(f"\n{'size':>8}  {'ingest/s':>9}  {'scan s':>7}  {'mode':>5}  {'p50 ms':>8}  {'p95 ms':>8}  {'p99 ms':>8}  {'RCU':>9}")
+    for run in results["runs"]:
+        first = True
+        for name, mode in run["search"].items():
+            lead = (f"{run['corpus_size']:>8}  {run['ingest']['items_per_second']:>9.0f}  {run['scan']['seconds']:>7.2f}"
+                    if first else " " * 28)
+            print(f"{lead}  {name:>5}  {mode.get('p50_ms', 0):>8.2f}  {mode.get('p95_ms', 0):>8.2f}  "
+                  f"{mode.get('p99_ms', 0):>8.2f}  {mode['capacity'].get('read_capacity_units', 0):>9.1f}")
+            first = False
+
+
+if __name__ == "__main__":
+    main()
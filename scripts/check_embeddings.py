@@ -1,40 +1,41 @@
-import boto3
-import json
+import sys
+import os
+from collections import Counter
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from RAG.resources import get_registry
+from RAG.scan import scan_items
+from RAG.vector_codec import decode_vector
 
 def check_dynamodb_embeddings():
     """Check what's stored in DynamoDB Local"""
     
     # Connect to DynamoDB Local
-    dynamodb = boto3.resource(
-        'dynamodb',
-        endpoint_url='http://localhost:8000',
-        region_name='us-east-1',
-        aws_access_key_id='fake',
-        aws_secret_access_key='fake'
-    )
+    dynamodb = get_registry().resource('dynamodb', local=True)
     
     table = dynamodb.Table('EMBEDDINGS')
     
     try:
-        # Get table info
-        response = table.scan()
-        items = response['Items']
+        # Stream every page of the table instead of only the first 1 MB
+        sample = None
+        sources = Counter()
+        for item in scan_items(table, total_segments=4):
+            if sample is None:
+                sample = item
+            sources[item['source']] += 1
         
-        print(f"📊 Total embeddings stored: {len(items)}")
+        print(f"📊 Total embeddings stored: {sum(sources.values())}")
         
-        if items:
+        if sample:
             print("\n📄 Sample embedding:")
-            sample = items[0]
             print(f"  ID: {sample['id']}")
             print(f"  Source: {sample['source']}")
             print(f"  Content preview: {sample['content'][:100]}...")
-            print(f"  Vector size: {len(sample['vector'])}")
+            print(f"  Vector size: {len(decode_vector(sample))}")
             print(f"  Page: {sample.get('page', 'N/A')}")
             
             print(f"\n📁 Sources found:")
-            sources = set(item['source'] for item in items)
-            for source in sources:
-                count = sum(1 for item in items if item['source'] == source)
+            for source, count in sources.items():
                 print(f"  {source}: {count} chunks")
         else:
             print("❌ No embeddings found in DynamoDB")
@@ -44,4 +45,4 @@ def check_dynamodb_embeddings():
         print("Make sure DynamoDB Local is running on port 8000")
 
 if __name__ == "__main__":
-    check_dynamodb_embeddings()
\ No newline at end of file
+    check_dynamodb_embeddings()
@@ -1,57 +1,19 @@
-import boto3
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 from botocore.exceptions import ClientError
+from RAG.resources import get_registry
+from RAG.schema import embeddings_table_definition
 
 def create_dynamodb_tables(local=True):
     """Create DynamoDB tables for the application"""
-    if local:
-        # Use DynamoDB Local
-        dynamodb = boto3.client(
-            'dynamodb',
-            endpoint_url='http://localhost:8000',
-            region_name='us-east-1',
-            aws_access_key_id='fake',
-            aws_secret_access_key='fake'
-        )
-    else:
-        # Use AWS DynamoDB
-        dynamodb = boto3.client('dynamodb', region_name='us-east-1')
+    # DynamoDB Local or AWS DynamoDB
+    dynamodb = get_registry().client('dynamodb', local=local)
     
     # Create EMBEDDINGS table
     try:
-        embeddings_table = dynamodb.create_table(
-            TableName='EMBEDDINGS',
-            KeySchema=[
-                {
-                    'AttributeName': 'id',
-                    'KeyType': 'HASH'  # Partition key
-                }
-            ],
-            AttributeDefinitions=[
-                {
-                    'AttributeName': 'id',
-                    'AttributeType': 'S'
-                },
-                {
-                    'AttributeName': 'source',
-                    'AttributeType': 'S'
-                }
-            ],
-            GlobalSecondaryIndexes=[
-                {
-                    'IndexName': 'Source-Index',
-                    'KeySchema': [
-                        {
-                            'AttributeName': 'source',
-                            'KeyType': 'HASH'
-                        }
-                    ],
-                    'Projection': {
-                        'ProjectionType': 'ALL'
-                    }
-                }
-            ],
-            BillingMode='PAY_PER_REQUEST'
-        )
+        embeddings_table = dynamodb.create_table(**embeddings_table_definition())
         print("✅ EMBEDDINGS table created successfully")
     except ClientError as e:
         if e.response['Error']['Code'] == 'ResourceInUseException':
@@ -0,0 +1,74 @@
+import argparse
+import json
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from RAG.evaluation import EVAL_QUESTIONS_PATH, Evaluator, load_questions
+from RAG.resources import configure_resources
+from RAG.stubs import StubOllamaServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer and judge evaluation questions concurrently and report quality and latency.")
+    parser.add_argument("questions", nargs="?", default=EVAL_QUESTIONS_PATH,
+                        help="JSON Lines of {question, expected_response, expected_sources}.")
+    parser.add_argument("--workers", type=int, default=4, help="Questions answered and judged at once.")
+    parser.add_argument("--model", default="llama3.1", help="Ollama model that answers.")
+    parser.add_argument("--judge-model", default="llama3.1", help="Ollama model that judges answers.")
+    parser.add_argument("--batch-retrieval", action="store_true", help="Retrieve every question up front with one batched search.")
+    parser.add_argument("--use-answer-cache", action="store_true", help="Reuse cached answers instead of generating every time.")
+    parser.add_argument("--ollama-url", help="Ollama server to use, e.g. one started with `python -m RAG.stubs`.")
+    parser.add_argument("--stub", action="store_true",
+                        help="Start a stub Ollama server in-process (hashed embeddings, extractive answers) for offline runs.")
+    parser.add_argument("--stub-delay", type=float, default=0.0, help="Seconds the stub adds to each generation.")
+    parser.add_argument("--output", default="evaluation_results.json", help="Where to write the JSON report.")
+    args = parser.parse_args()
+
+    stub = None
+    if args.stub:
+        stub = StubOllamaServer(delay=args.stub_delay).start()
+        print(f"🧪 Stub Ollama server on {stub.url}")
+        args.ollama_url = stub.url
+    if args.ollama_url:
+        # Before anything creates an Ollama client
+        configure_resources(ollama_base_url=args.ollama_url)
+
+    cases = load_questions(args.questions)
+    print(f"📝 {len(cases)} questions, {args.workers} workers")
+    try:
+        report = Evaluator(args.workers, args.model, args.judge_model,
+                           batch_retrieval=args.batch_retrieval, use_answer_cache=args.use_answer_cache).run(cases)
+    finally:
+        if stub is not None:
+            stub.stop()
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print_summary(report)
+    print(f"\n💾 Results written to {args.output}")
+
+
+def print_summary(report):
+    accuracy = report["accuracy"]
+    retrieval = report["retrieval"]
+    print(f"\n✅ Passed {accuracy['passed']}/{accuracy['judged']} judged ({accuracy['pass_rate']:.0%}), "
+          f"{accuracy['unclear_verdicts']} unclear, {report['errors']} errors")
+    print(f"🎯 Retrieval hit rate {retrieval['hit_rate']:.0%}, MRR {retrieval['mrr']:.2f} "
+          f"over {retrieval['questions_with_sources']} questions with expected sources")
+    print(f"⚡ {report['questions_per_second']:.2f} questions/s, {report['wall_seconds']:.1f}s wall")
+    if report["batch_retrieval"]:
+        print("📦 Batch retrieval: " + ", ".join(f"{name} {ms:.1f} ms" for name, ms in report["batch_retrieval"].items()))
+
+    print(f"\n{'stage':<16}  {'p50 ms':>9}  {'p95 ms':>9}  {'p99 ms':>9}  {'mean ms':>9}")
+    for stage, stats in report["stages"].items():
+        print(f"{stage:<16}  {stats['p50_ms']:>9.1f}  {stats['p95_ms']:>9.1f}  {stats['p99_ms']:>9.1f}  {stats['mean_ms']:>9.1f}")
+
+    for case in report["cases"]:
+        if case["error"] or case["passed"] is not True:
+            outcome = case["error"] or ("failed" if case["passed"] is False else "unclear verdict")
+            print(f"\n❌ {case['question']}\n   {outcome}; expected {case['expected_response']!r}, got {case['answer'][:200]!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import argparse
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from RAG.dynamodb_vector_store import DynamoDBVectorStore
+from RAG.vector_codec import VECTOR_VERSIONS
+
+def migrate_vectors():
+    """Rewrite stored embedding vectors in place into another storage format"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--format", choices=list(VECTOR_VERSIONS), default="float32", help="Target vector format.")
+    parser.add_argument("--table", default="EMBEDDINGS", help="Table to migrate.")
+    parser.add_argument("--aws", action="store_true", help="Use AWS DynamoDB instead of DynamoDB Local.")
+    args = parser.parse_args()
+
+    print(f"🔄 Migrating vectors in {args.table} to '{args.format}'...")
+    db = DynamoDBVectorStore(table_name=args.table, local=not args.aws, vector_format=args.format)
+    report = db.migrate_vectors()
+
+    print(f"✅ Migrated {len(report.succeeded)} items")
+    if report.failed:
+        print(f"❌ Failed to migrate {len(report.failed)} items:")
+        for doc_id, error in report.failed.items():
+            print(f"  {doc_id}: {error}")
+
+if __name__ == "__main__":
+    migrate_vectors()